@@ -77,20 +77,13 @@ def retinotopy(Rs,Ps):
     return Px, Py
 
 def square(x,y,width,height):
+    shader = glumpy.shader.get_blit()
+    shader.bind()
     gl.glColor4f(1,1,1,.5)
-    gl.glBegin(gl.GL_QUADS)
-    gl.glVertex2i(x,y)
-    gl.glVertex2i(x+width,y)
-    gl.glVertex2i(x+width,y+height)
-    gl.glVertex2i(x,y+height)
-    gl.glEnd()
+    glumpy.quad.draw(shader, x, y, width, height)
     gl.glColor4f(1,1,1,1)
-    gl.glBegin(gl.GL_LINE_LOOP)
-    gl.glVertex2i(x,y)
-    gl.glVertex2i(x+width,y)
-    gl.glVertex2i(x+width,y+height)
-    gl.glVertex2i(x,y+height)
-    gl.glEnd()
+    glumpy.quad.draw(shader, x, y, width, height, mode=gl.GL_LINE_LOOP)
+    shader.unbind()
 
 
 # -----------------------------------------------------------------------------
@@ -130,7 +123,6 @@ if __name__ == '__main__':
         Vi.update()
         Si.blit(0,0,S.shape[1],S.shape[0])
         Vi.blit(S.shape[1],0,2*V.shape[1], 2*V.shape[0])
-        gl.glDisable(gl.GL_TEXTURE_2D)
         square(X,window.height-Y,256,-256)
 
     window.mainloop()
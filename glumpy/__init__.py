@@ -11,15 +11,22 @@ import OpenGL.GLU as glu
 import OpenGL.GLUT as glut
 from proxy import Proxy
 from color import Color
-from image import Image
+from image import Image, TiledImage
 from window import Window, active_window
 from figure import Figure, figure, Frame, show
 from label import Label
 from vertex_buffer import VertexBuffer
 from layout import layout
-from texture import Texture
+from texture import Texture, TiledTexture
+from stream import Stream
 from trackball import Trackball
 import colormap
+import autoscale
+import norm
+import histogram
+import pyramid
+import state
+import quad
 
 try:
     import pylab
@@ -46,6 +46,7 @@ class Image(object):
         '''
 
         self._lut = None
+        self._bias, self._scale = 0.0, 1.0
         self._interpolation = interpolation
         self.texture = texture.Texture(Z)
         self.cmap = cmap
@@ -108,8 +109,7 @@ class Image(object):
     def cmap(self, cmap):
         ''' Colormap to be used to represent the array. '''
         self._cmap = cmap
-        colors = self.cmap.LUT['rgb'][1:].flatten().view((np.float32,3))
-        self._lut = texture.Texture(colors)
+        self._lut = cmap.texture()
         self.interpolation = self.interpolation # This is not a no-op line
 
     @property
@@ -165,6 +165,8 @@ class Image(object):
     def vmin(self, vmin):
         ''' Minimal representable value. '''
         self._vmin = vmin
+        if hasattr(self, 'Z'):
+            self._normalize()
 
     @property
     def vmax(self):
@@ -175,32 +177,42 @@ class Image(object):
     def vmax(self, vmax):
         ''' Maximal representable value. '''
         self._vmax = vmax
-        
+        if hasattr(self, 'Z'):
+            self._normalize()
+
     def update(self):
         ''' Data update. '''
-        if self.vmin is None:
+        self.texture.update()
+        self._normalize()
+
+    def _normalize(self):
+        ''' Set shader normalization such that vmin maps to 0 and vmax to 1
+            (alpha data only, see image.Image). '''
+        self._bias, self._scale = 0.0, 1.0
+        if self.texture.src_format not in [gl.GL_ALPHA,gl.GL_LUMINANCE_ALPHA]:
+            return
+        vmin, vmax = self.vmin, self.vmax
+        if vmin is None:
             vmin = self.Z.min()
-        else:
-            vmin = self.vmin
-        if self.vmax is None:
+        if vmax is None:
             vmax = self.Z.max()
-        else:
-            vmax = self.vmax
-        if self._lut:
-            s = self._lut.width
-            self.texture.update(bias = 1.0/(s-1)-vmin*((s-3.1)/(s-1))/(vmax-vmin),
-                                scale = ((s-3.1)/(s-1))/(vmax-vmin))
-        else:
-            self.texture.update(bias=-vmin/(vmax-vmin),scale=1.0/(vmax-vmin))
+        if vmin == vmax:
+            vmin, vmax = 0, 1
+        self._scale = 1.0/(vmax-vmin)
+        self._bias = -vmin*self._scale
 
     def blit(self, x, y, w, h):
         ''' Blit array onto active framebuffer. '''
         if self.shader:
+            # Colormap texture is updated if colormap has been modified
+            self._lut = self._cmap.texture()
+            self.shader._bias = self._bias
+            self.shader._scale = self._scale
             self.shader.bind(self.texture,self._lut)
         if self.origin == 'lower':
             t=0,1
         else:
             t=1,0
-        self.texture.blit(x,y,w,h,t=t)
+        self.texture.blit(x,y,w,h,t=t,shader=self.shader)
         if self.shader:
             self.shader.unbind()
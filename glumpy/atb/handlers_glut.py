@@ -92,3 +92,5 @@ class Handlers(object):
 
     def on_draw(self):
         TwDraw()
+        # AntTweakBar changes program, textures and blending behind the cache
+        glumpy.state.reset()
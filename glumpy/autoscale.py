@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Autoscale policies.
+
+    An autoscale policy computes the (vmin,vmax) display range of an array
+    whenever it is not given explicitly. The default policy computes the exact
+    range using a single pass over the array while other policies trade
+    exactness for speed (sampling) or stability (smoothing, percentiles).
+
+    Example:
+    --------
+      I = Image(Z, autoscale=autoscale.Smooth(alpha=0.05))
+'''
+import math
+import numpy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+# Number of items processed at once, small enough to stay in cache
+CHUNKSIZE = 2**16
+
+_pool = None
+
+
+def _get_pool():
+    ''' Get the (lazily created) process-wide thread pool. '''
+
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool(multiprocessing.cpu_count())
+    return _pool
+
+
+def _reduce(chunks):
+    ''' Compute min and max over a list of chunks. '''
+
+    vmin, vmax = chunks[0].min(), chunks[0].max()
+    for C in chunks[1:]:
+        vmin = numpy.minimum(vmin, C.min())
+        vmax = numpy.maximum(vmax, C.max())
+    return vmin, vmax
+
+
+def minmax(Z, chunksize=CHUNKSIZE, threads=None):
+    ''' Compute min and max of Z in a single pass.
+
+    The array is split in chunks (along first axis) that are small enough to
+    stay in cache between the min and the max reductions such that the array
+    is only read once from memory. Chunks are dispatched to a thread pool
+    since numpy releases the GIL during reductions.
+
+    Parameters
+    ----------
+    Z: numpy array
+        Array to be reduced (may be a non-contiguous view)
+
+    chunksize: int
+        Approximate number of items per chunk
+
+    threads: int or None
+        Number of threads to use (None means number of cpus)
+    '''
+    Z = numpy.asanyarray(Z)
+    if Z.ndim == 0 or Z.size <= chunksize:
+        return Z.min(), Z.max()
+    rows = max(1, chunksize // (Z.size // Z.shape[0]))
+    chunks = [Z[i:i+rows] for i in range(0, Z.shape[0], rows)]
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+    if threads > 1 and len(chunks) >= 2*threads:
+        groups = [chunks[i::threads] for i in range(threads)]
+        results = _get_pool().map(_reduce, groups)
+    else:
+        results = [_reduce(chunks)]
+    results = numpy.array(results)
+    return results[:,0].min(), results[:,1].max()
+
+
+def sample(Z, samples):
+    ''' Return a strided view of Z holding approximately given number of
+        samples (over the first two axes). '''
+
+    Z = numpy.asanyarray(Z)
+    if Z.size <= samples:
+        return Z
+    if Z.ndim == 1:
+        return Z[::int(math.ceil(Z.size/float(samples)))]
+    step = int(math.ceil(math.sqrt(Z.size/float(samples))))
+    return Z[::step,::step]
+
+
+
+class Autoscale(object):
+    ''' Exact autoscale policy (fused single pass min/max). '''
+
+    def __init__(self, threads=None):
+        '''
+        Parameters
+        ----------
+        threads: int or None
+            Number of threads to use (None means number of cpus)
+        '''
+        self._threads = threads
+        self._range = None
+        self._widen = None
+
+    def __call__(self, Z):
+        ''' Return (vmin,vmax) for Z. '''
+        if self._range is None or self._widen is None:
+            self._range = self._compute(Z)
+        else:
+            vmin, vmax = self._range
+            for region in self._widen:
+                lo, hi = minmax(Z[region], threads=self._threads)
+                vmin, vmax = min(vmin, lo), max(vmax, hi)
+            self._range = vmin, vmax
+        self._widen = None
+        return self._range
+
+    def _compute(self, Z):
+        ''' Compute (vmin,vmax) over the whole array. '''
+        return minmax(Z, threads=self._threads)
+
+    def reset(self):
+        ''' Forget any state accumulated over previous calls. '''
+        self._range = None
+        self._widen = None
+
+    def update(self, region=None, widen=False):
+        ''' Take into account that region(s) of the array (given as in
+            Image.update) have been modified before next call.
+
+        If widen is true (see Image.append), next range is only widened to
+        include values of region(s) instead of being computed over the whole
+        array, such that it never shrinks.
+        '''
+        if not widen or region is None:
+            self._range = None
+        elif self._range is not None:
+            if type(region) is not list:
+                region = [region]
+            self._widen = (self._widen or []) + region
+
+
+
+class Sampled(Autoscale):
+    ''' Autoscale policy computing range over a strided subsample. '''
+
+    def __init__(self, samples=CHUNKSIZE, threads=None):
+        '''
+        Parameters
+        ----------
+        samples: int
+            Approximate number of samples to consider
+        '''
+        Autoscale.__init__(self, threads)
+        self._samples = samples
+
+    def _compute(self, Z):
+        return minmax(sample(Z, self._samples), threads=self._threads)
+
+
+
+class Smooth(Autoscale):
+    ''' Autoscale policy using an exponential moving range across frames. '''
+
+    def __init__(self, alpha=0.1, policy=None):
+        '''
+        Parameters
+        ----------
+        alpha: float
+            Weight of the new range (0 < alpha <= 1)
+
+        policy: Autoscale
+            Policy used to compute the range of a single frame
+        '''
+        Autoscale.__init__(self)
+        self._alpha = alpha
+        self._policy = policy or Autoscale()
+        self._range = None
+
+    def __call__(self, Z):
+        vmin, vmax = self._policy(Z)
+        if self._range is None:
+            self._range = vmin, vmax
+        else:
+            a = self._alpha
+            self._range = ((1-a)*self._range[0] + a*vmin,
+                           (1-a)*self._range[1] + a*vmax)
+        return self._range
+
+    def reset(self):
+        self._range = None
+        self._policy.reset()
+
+    def update(self, region=None, widen=False):
+        self._policy.update(region, widen)
+
+
+
+class Percentile(Autoscale):
+    ''' Autoscale policy using percentiles of a running histogram. '''
+
+    def __init__(self, low=1.0, high=99.0, bins=1024,
+                 decay=0.5, samples=CHUNKSIZE):
+        '''
+        Parameters
+        ----------
+        low, high: float
+            Percentiles (in [0,100]) to be used as vmin and vmax
+
+        bins: int
+            Number of histogram bins
+
+        decay: float
+            Weight of the previous histogram when a new frame is accumulated
+
+        samples: int
+            Approximate number of samples to consider per frame
+        '''
+        Autoscale.__init__(self)
+        self._low, self._high = low, high
+        self._bins = bins
+        self._decay = decay
+        self._samples = samples
+        self._counts = None
+        self._bounds = None
+
+    def __call__(self, Z):
+        S = sample(Z, self._samples)
+        vmin, vmax = minmax(S)
+        if (self._counts is None or
+            vmin < self._bounds[0] or vmax > self._bounds[1]):
+            margin = 0.05*(vmax-vmin)
+            self._bounds = vmin-margin, vmax+margin
+            self._counts = numpy.zeros(self._bins)
+        if self._bounds[0] == self._bounds[1]:
+            return vmin, vmax
+        counts, edges = numpy.histogram(S, self._bins, range=self._bounds)
+        self._counts *= self._decay
+        self._counts += counts
+        cdf = numpy.cumsum(self._counts)
+        lo = numpy.searchsorted(cdf, cdf[-1]*self._low/100.0)
+        hi = numpy.searchsorted(cdf, cdf[-1]*self._high/100.0)
+        return edges[lo], edges[min(hi+1, self._bins)]
+
+    def reset(self):
+        self._counts = None
+        self._bounds = None
+
+    def update(self, region=None, widen=False):
+        ''' Percentiles are always computed from a new sample. '''
+        pass
@@ -12,13 +12,94 @@
     value is normalized between 0 and 1. over, under and bad value can be
     assigned special colors.
 
+    Lookup tables (LUT) are built on demand for each requested representation
+    ('rgb', 'rgba' as normalized floats, 'RGB', 'RGBA' as unsigned bytes) and
+    are made of bad, under, size interpolated colors and over colors. They are
+    rebuilt when the colormap is modified.
+
+    The 'rgba' table (without bad color) is also available as a 1D texture
+    shared by all images using the colormap, see texture(). Arrays can be
+    colormapped without any GL context using map().
+
     Example:
     --------
-      cmap = Colormap((0., (0.,0.,0.,1.)),
-                      (1., (1.,1.,1.,1.)))
+      cmap = Colormap("Grey", (0., (0.,0.,0.,1.)),
+                              (1., (1.,1.,1.,1.)), size=1024)
+      LUT = cmap.LUT['RGBA']
+      RGBA = cmap.map(Z, vmin=0.0, vmax=1.0)
 '''
 import numpy
+import weakref
+import multiprocessing
 from color import Color
+import state
+
+# Number of array elements colormapped at once, small enough to stay in cache
+# (same as autoscale.CHUNKSIZE)
+_chunk = 2**16
+
+# Colormaps having a texture, indexed by id
+_textured = weakref.WeakValueDictionary()
+
+
+def _forget():
+    ''' Forget textures of previous context (without deleting them since
+        their names may be reused by the new context). '''
+    for cmap in _textured.values():
+        cmap._texture._id = 0
+        cmap._texture = None
+    _textured.clear()
+
+state.on_new_context(_forget)
+
+
+def _map(args):
+    ''' Colormap Z into out using LUT and (float, index, mask) scratch
+        buffers, chunk by chunk. '''
+
+    Z, out, LUT, vmin, vmax, scratch = args
+    n = len(LUT)-3
+    scale = 0.0
+    if vmax > vmin:
+        scale = (n-1)/float(vmax-vmin)
+    for start in range(0, Z.size, _chunk):
+        z = Z[start:start+_chunk]
+        size = z.size
+        t, i, m = scratch[0][:size], scratch[1][:size], scratch[2][:size]
+
+        # Index of nearest color, skipping bad and under colors
+        numpy.subtract(z, vmin, out=t)
+        numpy.multiply(t, scale, out=t)
+        numpy.add(t, 2.5, out=t)
+        numpy.clip(t, 1, n+2, out=t)
+        numpy.isnan(t, out=m)
+        numpy.copyto(t, 0, where=m)
+        numpy.copyto(i, t, casting='unsafe')
+
+        # Bad, under and over colors (nan values compare as false)
+        numpy.copyto(i, 0, where=m)
+        with numpy.errstate(invalid='ignore'):
+            numpy.less(z, vmin, out=m)
+            numpy.copyto(i, 1, where=m)
+            numpy.greater(z, vmax, out=m)
+            numpy.copyto(i, n+2, where=m)
+
+        LUT.take(i, axis=0, out=out[start:start+size], mode='clip')
+
+
+class _LUT(dict):
+    ''' Lookup tables of a colormap indexed by representation, missing ones
+        being built when requested. '''
+
+    def __init__(self, cmap):
+        dict.__init__(self)
+        self._cmap = cmap
+
+    def __missing__(self, key):
+        LUT = self._cmap._build(key)
+        self[key] = LUT
+        return LUT
+
 
 class Colormap:
     ''' '''
@@ -43,14 +124,18 @@ class Colormap:
 
            under: Color
                Color to be used for low out-of-range values.
+
+           size: int
+               Number of interpolated colors of lookup tables (default 510).
         '''
         self.name = name
         self.vcolors = []
-        self.LUT = {}
-        self.LUT['rgb'] = None
-        self.LUT['RGB'] = None
-        self.LUT['rgba'] = None
-        self.LUT['RGBA'] = None
+        self.LUT = _LUT(self)
+        self.version = 0
+        self._texture = None
+        self._texture_version = None
+        self._scratch = []
+        self.size = kwargs.get('size', 510)
         self.under = Color(0., 0., 0., 1.)
         self.over  = Color(0., 0., 0., 1.)
         self.bad   = Color(0., 0., 0., 1.)
@@ -58,7 +143,6 @@ class Colormap:
         self.alpha = 1.0
         for value,color in args:
             self._append( value, Color(color) )
-        self._update()
         self.under = kwargs.get('under', self._get_color(-1.0))
         self.over = kwargs.get('over', self._get_color(1.0))
         self.bad = kwargs.get('bad', Color(0.,0.,0.,1.))
@@ -74,6 +158,11 @@ class Colormap:
             color.alpha = alpha
         self._update()
 
+    def set_size(self, size):
+        ''' Set number of interpolated colors of lookup tables. '''
+        self.size = size
+        self._update()
+
     def set_under(self, *args):
         ''' Set color to be used for low out-of-range values. '''
         self.under = Color(*args)
@@ -92,52 +181,135 @@ class Colormap:
     def _append( self, value, color ):
         ''' Append a new value/color '''
         self.vcolors.append( [value,color] )
-        self.vcolors.sort( lambda x,y: int(x[0]-y[0]) )
+        self.vcolors.sort( key=lambda vcolor: vcolor[0] )
 
     def _update(self):
         ''' Update internal representations '''
         
-        n = 510
-        self.LUT['RGB']  = [(0,0,0)]*(n+3)
-        self.LUT['rgb']  = [(0.0,0.0,0.0)]*(n+3)
-        self.LUT['RGBA'] = [(0,0,0,0)]*(n+3)
-        self.LUT['rgba'] = [(0.0,0.0,0.0,0.0)]*(n+3)
-        self.LUT['RGB'][0]  = self.bad.RGB
-        self.LUT['RGB'][1]  = self.under.RGB
-        self.LUT['RGB'][-1] = self.over.RGB
-        self.LUT['RGBA'][0]  = self.bad.RGBA
-        self.LUT['RGBA'][1]  = self.under.RGBA
-        self.LUT['RGBA'][-1] = self.over.RGBA
-        self.LUT['rgb'][0]  = self.bad.rgb
-        self.LUT['rgb'][1]  = self.under.rgb
-        self.LUT['rgb'][-1] = self.over.rgb
-        self.LUT['rgba'][0]  = self.bad.rgba
-        self.LUT['rgba'][1]  = self.under.rgba
-        self.LUT['rgba'][-1] = self.over.rgba
-        for i in range( n ):
-            c = self._get_color( i/float(n-1) )
-            self.LUT['RGB'][2+i] = c.RGB
-            self.LUT['RGBA'][2+i] = c.RGBA
-            self.LUT['rgb'][2+i] = c.rgb
-            self.LUT['rgba'][2+i] = c.rgba
-        self.LUT['RGB'] = numpy.array( self.LUT['RGB'],
-                                       dtype=[('R',numpy.ubyte),
-                                              ('G',numpy.ubyte),
-                                              ('B',numpy.ubyte)])
-        self.LUT['rgb'] = numpy.array( self.LUT['rgb'],
-                                       dtype=[('r',numpy.float32),
-                                              ('g',numpy.float32),
-                                              ('b',numpy.float32)])
-        self.LUT['RGBA'] = numpy.array( self.LUT['RGBA'],
-                                        dtype=[('R',numpy.ubyte),
-                                               ('G',numpy.ubyte),
-                                               ('B',numpy.ubyte),
-                                               ('A',numpy.ubyte)])
-        self.LUT['rgba'] = numpy.array( self.LUT['rgba'],
-                                        dtype=[('r',numpy.float32),
-                                               ('g',numpy.float32),
-                                               ('b',numpy.float32),
-                                               ('a',numpy.float32)])
+        # Lookup tables are rebuilt when next requested
+        self.LUT.clear()
+        self.version += 1
+
+    def texture(self):
+        ''' Shared 1D texture of the 'rgba' lookup table (without bad color),
+            such that alpha of colors (and of under and over colors) is
+            rendered.
+
+        The texture is created when first requested (a GL context must
+        exist) and is updated in place if the colormap has been modified
+        since.
+        '''
+
+        import texture
+        colors = self.LUT['rgba'][1:].view((numpy.float32,4))
+        if self._texture is None or self._texture.width != len(colors):
+            self._texture = texture.Texture(colors)
+            _textured[id(self)] = self
+        elif self._texture_version != self.version:
+            self._texture.data = colors
+            self._texture.update()
+        self._texture_version = self.version
+        return self._texture
+
+    def _build(self, format):
+        ''' Build lookup table for given representation ('rgb', 'RGB', 'rgba'
+            or 'RGBA'). '''
+
+        if format not in ['rgb', 'RGB', 'rgba', 'RGBA']:
+            raise KeyError(format)
+        n = self.size
+        colors = numpy.zeros((n+3, 4))
+        colors[0]  = self.bad.rgba
+        colors[1]  = self.under.rgba
+        colors[-1] = self.over.rgba
+        if not len(self.vcolors):
+            colors[2:-1] = 0., 0., 0., self.alpha
+        else:
+            values = [value for value, color in self.vcolors]
+            vcolors = numpy.array([color.rgba for value, color in self.vcolors])
+            x = numpy.linspace(0.0, 1.0, n)
+            for i in range(4):
+                colors[2:-1,i] = numpy.interp(x, values, vcolors[:,i])
+
+        colors = colors[:,:len(format)]
+        if format.isupper():
+            colors = (colors*255).astype(numpy.ubyte)
+            dtype = [(c, numpy.ubyte) for c in format]
+        else:
+            colors = colors.astype(numpy.float32)
+            dtype = [(c, numpy.float32) for c in format]
+        return numpy.ascontiguousarray(colors).view(dtype).reshape(n+3)
+
+    def map(self, Z, vmin=None, vmax=None, out=None, bytes=True):
+        ''' Colormap an array of scalars.
+
+        Values are normalized with vmin and vmax, nan values get the bad
+        color while out-of-range values get the under and over colors.
+
+        Large arrays are split across a pool of threads (numpy releases the
+        GIL). Using the same output array (and giving vmin and vmax) for
+        arrays of same size, scratch buffers are reused and nothing is
+        allocated. Scratch buffers belong to the colormap which must then
+        not be used by several threads at once.
+
+        Parameters
+        ----------
+           Z: numpy array
+               Scalar values (a contiguous array is not copied).
+
+           vmin, vmax: scalar
+               Values mapped to first and last colors (Z extrema if None).
+
+           out: numpy array
+               Contiguous output array with shape Z.shape+(4,) and dtype
+               uint8 (bytes) or float32.
+
+           bytes: bool
+               Whether to output RGBA bytes or normalized rgba floats.
+
+        Returns
+        -------
+        out
+        '''
+
+        Z = numpy.asarray(Z)
+        if bytes:
+            LUT = self.LUT['RGBA'].view((numpy.ubyte,4))
+        else:
+            LUT = self.LUT['rgba'].view((numpy.float32,4))
+        if out is None:
+            out = numpy.empty(Z.shape+(4,), dtype=LUT.dtype)
+        elif (out.shape != Z.shape+(4,) or out.dtype != LUT.dtype
+              or not out.flags['C_CONTIGUOUS']):
+            raise ValueError('Output array must be contiguous with shape %s '
+                             'and dtype %s' % (Z.shape+(4,), LUT.dtype))
+        if vmin is None:
+            vmin = numpy.nanmin(Z)
+        if vmax is None:
+            vmax = numpy.nanmax(Z)
+        result = out
+        Z = Z.reshape(-1)
+        out = out.reshape(-1,4)
+
+        # Workers colormap contiguous parts of Z, chunk by chunk
+        count = 1
+        if Z.size > 2*_chunk:
+            count = min(multiprocessing.cpu_count(), Z.size//_chunk)
+        while len(self._scratch) < count:
+            self._scratch.append((numpy.empty(_chunk),
+                                  numpy.empty(_chunk, dtype=numpy.intp),
+                                  numpy.empty(_chunk, dtype=bool)))
+        bounds = numpy.linspace(0, Z.size, count+1).astype(int)
+        parts = [(Z[bounds[i]:bounds[i+1]], out[bounds[i]:bounds[i+1]],
+                  LUT, vmin, vmax, self._scratch[i]) for i in range(count)]
+        if count > 1:
+            # Thread pool is shared with autoscale (imported only when needed
+            # such that colormap does not depend on it)
+            import autoscale
+            autoscale._get_pool().map(_map, parts)
+        else:
+            _map(parts[0])
+        return result
 
     def _get_color (self, value):
         ''' Get interpolated color from value '''
@@ -200,31 +372,5 @@ if __name__ == '__main__':
     cmap.set_under(1.,0.,0.,1.)
     cmap.set_over(0.,0.,1.,1.)
     cmap.set_bad(1.,0.,1.,0.)
-    LUT = cmap.LUT['RGBA']
     Z = numpy.array([0,.5,1,-1, 2, numpy.NaN])
-    zmin, zmax = 0.0, 1.0
-
-    # LUT.size = bad + under + actual # colors + over
-    Zn = (Z-zmin)
-    Zn *= (LUT.size-3-1)/float(zmax-zmin)
-    Zi = Zn.astype(numpy.int)
-
-    # Zn holds unranged indices of colors
-    # At this stage, they can be negative or superior to LUT.size-3
-
-    # Set negative indices to become 'under' color (1)
-    #  and increment others by 2 to skip bad and under colors
-    Zi = numpy.maximum (Zi+2, 1)
-
-    # Set out-of-range indices to be 'over' color (LUT.size-1)
-    Zi = numpy.minimum (Zi, LUT.size-1)
-
-    # Replace too high indices with 'over' color index ( = 1)
- 
-    # Replace bad indices with 'bad' color
-    Zi = numpy.multiply(Zi, 1-numpy.isnan(Z))
-
-    I = LUT.take(Zi,mode='clip').view((numpy.ubyte,4))
-    print I
-
-
+    print cmap.map(Z, vmin=0.0, vmax=1.0)
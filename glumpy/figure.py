@@ -40,6 +40,7 @@ import OpenGL.GL as gl
 from event import EventDispatcher, EVENT_HANDLED, EVENT_UNHANDLED
 from window import Window, active_window
 import key, mouse
+import state, quad, shader, transforms
 
 
 # ------------------------------------------------------------------ figure ---
@@ -461,16 +462,17 @@ class Figure(EventDispatcher):
         entering mainloop and the figure will already have a valid GL context.
         '''
 
-        gl.glEnable (gl.GL_DEPTH_TEST)
-        gl.glEnable (gl.GL_LIGHT0)
-        gl.glLightfv (gl.GL_LIGHT0, gl.GL_DIFFUSE,  (1.0, 1.0, 1.0, 1.0))
-        gl.glLightfv (gl.GL_LIGHT0, gl.GL_AMBIENT,  (0.1, 0.1, 0.1, 1.0))
-        gl.glLightfv (gl.GL_LIGHT0, gl.GL_SPECULAR, (0.0, 0.0, 0.0, 1.0))
-        gl.glLightfv (gl.GL_LIGHT0, gl.GL_POSITION, (0.0, 1.0, 2.0, 1.0))
-        gl.glEnable (gl.GL_BLEND)
-        gl.glEnable (gl.GL_COLOR_MATERIAL)
-        gl.glColorMaterial(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE)
-        gl.glBlendFunc (gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        state.enable(gl.GL_DEPTH_TEST)
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        if not state.core():
+            state.enable(gl.GL_LIGHT0)
+            gl.glLightfv (gl.GL_LIGHT0, gl.GL_DIFFUSE,  (1.0, 1.0, 1.0, 1.0))
+            gl.glLightfv (gl.GL_LIGHT0, gl.GL_AMBIENT,  (0.1, 0.1, 0.1, 1.0))
+            gl.glLightfv (gl.GL_LIGHT0, gl.GL_SPECULAR, (0.0, 0.0, 0.0, 1.0))
+            gl.glLightfv (gl.GL_LIGHT0, gl.GL_POSITION, (0.0, 1.0, 2.0, 1.0))
+            state.enable(gl.GL_COLOR_MATERIAL)
+            gl.glColorMaterial(gl.GL_FRONT_AND_BACK, gl.GL_AMBIENT_AND_DIFFUSE)
 
         
         for fig in self._figures:
@@ -504,6 +506,8 @@ class Figure(EventDispatcher):
         framebuffer since the last time it was drawn.
         '''
 
+        if state.core():
+            return self._draw_core()
         for fig in self._figures:
             x,y,w,h = fig.viewport
             gl.glPushAttrib(gl.GL_VIEWPORT_BIT | gl.GL_SCISSOR_BIT)
@@ -522,6 +526,30 @@ class Figure(EventDispatcher):
             gl.glPopAttrib()
 
 
+    def _draw_core(self):
+        '''
+        Core profile version of on_draw: there is neither attribute nor
+        matrix stack and matrices are given to shaders (see state).
+        '''
+
+        viewport = gl.glGetIntegerv(gl.GL_VIEWPORT)
+        scissor = gl.glIsEnabled(gl.GL_SCISSOR_TEST)
+        box = gl.glGetIntegerv(gl.GL_SCISSOR_BOX)
+        for fig in self._figures:
+            x,y,w,h = fig.viewport
+            state.push_matrices()
+            state.projection = transforms.ortho(0, w, 0, h, -1000, 1000)
+            gl.glViewport(x,y,w,h)
+            gl.glEnable(gl.GL_SCISSOR_TEST)
+            gl.glScissor(x,y,w,h)
+            fig.dispatch_event('on_draw')
+            state.pop_matrices()
+        gl.glViewport(*viewport)
+        gl.glScissor(*box)
+        if not scissor:
+            gl.glDisable(gl.GL_SCISSOR_TEST)
+
+
 
     # ----------------------------------------------------------- on_resize ---
     def on_resize(self, width, height):
@@ -876,24 +904,16 @@ class Frame(Figure):
         x,y,z = x + .315, y + .315, -abs(z)
         w,h = int(round(self.width))- 1, int(round(self.height)) -1
 
-        gl.glDisable(gl.GL_BLEND)
-        gl.glDisable(gl.GL_LINE_SMOOTH)
-
-        gl.glColor(*self._bg_color)
-        gl.glBegin(gl.GL_QUADS)
-        gl.glVertex3f(x,   y,   z)
-        gl.glVertex3f(x+w, y,   z)
-        gl.glVertex3f(x+w, y+h, z)
-        gl.glVertex3f(x,   y+h, z)
-        gl.glEnd()
-
-        gl.glColor(*self._fg_color)
-        gl.glBegin(gl.GL_LINE_LOOP)
-        gl.glVertex3f(x,   y,   -z)
-        gl.glVertex3f(x+w, y,   -z)
-        gl.glVertex3f(x+w, y+h, -z)
-        gl.glVertex3f(x,   y+h, -z)
-        gl.glEnd()
+        state.disable(gl.GL_BLEND)
+        state.disable(gl.GL_LINE_SMOOTH)
+
+        solid = shader.get_blit()
+        solid.bind()
+        state.color(*self._bg_color)
+        quad.draw(solid, x, y, w, h, z)
+        state.color(*self._fg_color)
+        quad.draw(solid, x, y, w, h, -z, mode=gl.GL_LINE_LOOP)
+        solid.unbind()
 
 
 
@@ -36,6 +36,7 @@ import sys
 import math
 import numpy as np
 import OpenGL.GL as gl
+import state
 from freetype import *
 
 
@@ -97,16 +98,24 @@ class Atlas:
         if not self.texid:
             self.texid = gl.glGenTextures(1)
 
-        gl.glBindTexture( gl.GL_TEXTURE_2D, self.texid )
+        state.bind_texture(gl.GL_TEXTURE_2D, self.texid)
         gl.glTexParameteri( gl.GL_TEXTURE_2D,
-                            gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP )
+                            gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE )
         gl.glTexParameteri( gl.GL_TEXTURE_2D,
-                            gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP )
+                            gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE )
         gl.glTexParameteri( gl.GL_TEXTURE_2D,
                             gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR )
         gl.glTexParameteri( gl.GL_TEXTURE_2D,
                             gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR )
-        if self.depth == 1:
+        if self.depth == 1 and state.core():
+            # No alpha format, coverage is stored in red channel and read as
+            # alpha (over white) such that labels are colored by vertices
+            gl.glTexParameteriv( gl.GL_TEXTURE_2D, gl.GL_TEXTURE_SWIZZLE_RGBA,
+                                 [gl.GL_ONE, gl.GL_ONE, gl.GL_ONE, gl.GL_RED] )
+            gl.glTexImage2D( gl.GL_TEXTURE_2D, 0, gl.GL_R8,
+                             self.width, self.height, 0,
+                             gl.GL_RED, gl.GL_UNSIGNED_BYTE, self.data )
+        elif self.depth == 1:
             gl.glTexImage2D( gl.GL_TEXTURE_2D, 0, gl.GL_ALPHA,
                              self.width, self.height, 0,
                              gl.GL_ALPHA, gl.GL_UNSIGNED_BYTE, self.data )
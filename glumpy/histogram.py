@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Streaming histogram.
+
+    A Histogram is an autoscale policy computing (vmin,vmax) as percentiles of
+    a fixed-bins histogram of the array. The array is split in bands of rows
+    having their own histograms such that only bands intersecting modified
+    regions (see Image.update) are counted again, each band being counted in
+    a single chunked pass (possibly over a subsample). Percentiles are
+    interpolated within bins from the cumulated counts.
+
+    A View draws the histogram on screen.
+
+    Example:
+    --------
+      I = Image(Z, autoscale=histogram.Histogram(low=1.0, high=99.0))
+      Z[100:200] = ...
+      I.update((slice(100,200),))
+      H = histogram.View(I.autoscale)
+      H.draw(x, y, w, h)
+'''
+import math
+import numpy
+import multiprocessing
+import OpenGL.GL as gl
+import autoscale
+import shader
+import state
+from vertex_buffer import VertexBuffer
+
+
+def _rows(region, n):
+    ''' Convert a region given as slices into (start,stop) rows. '''
+
+    if type(region) is not tuple:
+        region = (region,)
+    r = region[0]
+    if type(r) is not slice:
+        r = int(r) % n
+        r = slice(r, r+1)
+    start, stop, step = r.indices(n)
+    if step < 0:
+        start, stop = stop+1, start+1
+    return start, max(start, stop)
+
+
+def _count(args):
+    ''' Count values of Z within bounds into bins+2 bins (first and last ones
+        counting values out of bounds), chunk by chunk. '''
+
+    Z, bins, bounds = args
+    counts = numpy.zeros(bins+2, dtype=numpy.int64)
+    if not Z.size:
+        return counts
+    scale = bins/float(bounds[1]-bounds[0])
+    rows = max(1, autoscale.CHUNKSIZE // (Z.size // Z.shape[0]))
+    for i in range(0, Z.shape[0], rows):
+        C = numpy.asarray(Z[i:i+rows], dtype=numpy.float64).reshape(-1)
+        C = C[numpy.isfinite(C)]
+        C -= bounds[0]
+        C *= scale
+        numpy.clip(C, -1, bins, out=C)
+        I = numpy.floor(C).astype(numpy.intp) + 1
+        counts += numpy.bincount(I, minlength=bins+2)
+    return counts
+
+
+
+class Histogram(autoscale.Autoscale):
+    ''' Autoscale policy using percentiles of a streaming histogram. '''
+
+    def __init__(self, low=1.0, high=99.0, bins=1024, bands=16, samples=None,
+                 threads=None):
+        '''
+        Parameters
+        ----------
+        low, high: float
+            Percentiles (in [0,100]) to be used as vmin and vmax
+
+        bins: int
+            Number of histogram bins
+
+        bands: int
+            Number of bands of rows the array is split into
+
+        samples: int or None
+            Approximate number of samples to consider per band (None means
+            all values)
+
+        threads: int or None
+            Number of threads to use (None means number of cpus)
+        '''
+        autoscale.Autoscale.__init__(self, threads)
+        self._low, self._high = low, high
+        self._bins = bins
+        self._bands = bands
+        self._samples = samples
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+        self._bounds = None
+        self._counts = numpy.zeros(self._bins+2, dtype=numpy.int64)
+        self._band_counts = None
+        self._band_rows = None
+        self._dirty = None
+        self._cdf = None
+
+    @property
+    def bounds(self):
+        ''' Range covered by bins (None until first call). '''
+        return self._bounds
+
+    @property
+    def edges(self):
+        ''' Edges of bins. '''
+        if self._bounds is None:
+            return None
+        return numpy.linspace(self._bounds[0], self._bounds[1], self._bins+1)
+
+    @property
+    def counts(self):
+        ''' Number of values per bin (values out of bounds excluded). '''
+        return self._counts[1:-1]
+
+    def update(self, region=None, widen=False):
+        ''' Mark rows of given region(s) as modified (percentiles being
+            always computed again, widen is ignored). '''
+        if self._band_rows is None or region is None:
+            self._dirty = None
+            return
+        if self._dirty is None:
+            # All bands are already to be counted again
+            return
+        if type(region) is not list:
+            region = [region]
+        for r in region:
+            start, stop = _rows(r, self._band_rows[-1][1])
+            for b, (r0, r1) in enumerate(self._band_rows):
+                if r0 < stop and start < r1:
+                    self._dirty.add(b)
+
+    def percentile(self, q):
+        ''' Approximate q-th percentile (q in [0,100]). '''
+        if self._cdf is None:
+            self._cdf = numpy.cumsum(self.counts)
+        cdf = self._cdf
+        if not cdf[-1]:
+            return self._bounds[0]
+        target = cdf[-1]*q/100.0
+        i = min(numpy.searchsorted(cdf, target), self._bins-1)
+        below = cdf[i-1] if i else 0
+        f = (target-below)/float(max(cdf[i]-below, 1))
+        width = (self._bounds[1]-self._bounds[0])/float(self._bins)
+        return self._bounds[0] + (i+min(f,1.0))*width
+
+    def __call__(self, Z):
+        Z = numpy.asanyarray(Z)
+        if Z.ndim == 3:
+            Z = Z[...,-1]
+        if Z.ndim == 0 or not Z.size:
+            return autoscale.minmax(Z)
+
+        if self._band_rows is None or self._band_rows[-1][1] != Z.shape[0]:
+            rows = int(math.ceil(Z.shape[0]/float(self._bands)))
+            self._band_rows = [(i, min(i+rows, Z.shape[0]))
+                               for i in range(0, Z.shape[0], rows)]
+            self._band_counts = None
+            self._dirty = None
+        if self._bounds is None:
+            self._rebound(Z)
+        if self._dirty is None or self._band_counts is None:
+            dirty = range(len(self._band_rows))
+        else:
+            dirty = sorted(self._dirty)
+
+        if dirty:
+            # All bands are counted again over new bounds if values fell out
+            # of current bounds or if values only cover a small part of
+            # them (bins would be too coarse)
+            counts = self._count(Z, dirty)
+            rebound = counts[:,0].any() or counts[:,-1].any()
+            if not rebound and len(dirty) == len(self._band_rows):
+                used = numpy.nonzero(counts[:,1:-1].sum(axis=0))[0]
+                rebound = len(used) > 1 and used[-1]-used[0] < self._bins//4
+            if rebound:
+                self._rebound(Z)
+                dirty = range(len(self._band_rows))
+                counts = self._count(Z, dirty)
+            if self._band_counts is None:
+                self._band_counts = numpy.zeros((len(self._band_rows),
+                                                 self._bins+2), numpy.int64)
+                self._counts[...] = 0
+            for b, C in zip(dirty, counts):
+                self._counts -= self._band_counts[b]
+                self._band_counts[b] = C
+                self._counts += C
+            self._cdf = None
+            self.version += 1
+        self._dirty = set()
+        return self.percentile(self._low), self.percentile(self._high)
+
+    def _band(self, Z, b):
+        ''' Rows (possibly subsampled) of given band. '''
+        r0, r1 = self._band_rows[b]
+        if self._samples:
+            return autoscale.sample(Z[r0:r1], self._samples)
+        return Z[r0:r1]
+
+    def _rebound(self, Z):
+        ''' Set bounds from the range of (sampled) values. '''
+        vmin, vmax = numpy.inf, -numpy.inf
+        for b in range(len(self._band_rows)):
+            B = self._band(Z, b)
+            lo, hi = autoscale.minmax(B, threads=self._threads)
+            if not (numpy.isfinite(lo) and numpy.isfinite(hi)):
+                # Non finite values are ignored
+                B = B[numpy.isfinite(B)]
+                if not B.size:
+                    continue
+                lo, hi = B.min(), B.max()
+            vmin, vmax = min(vmin, lo), max(vmax, hi)
+        if vmin > vmax:
+            vmin, vmax = 0.0, 1.0
+        margin = 0.05*(vmax-vmin) or 0.5
+        self._bounds = float(vmin-margin), float(vmax+margin)
+        self._band_counts = None
+
+    def _count(self, Z, bands):
+        ''' Count given bands (using the thread pool if several). '''
+        tasks = [(self._band(Z, b), self._bins, self._bounds) for b in bands]
+        threads = self._threads
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        if threads > 1 and len(tasks) > 1:
+            return numpy.array(autoscale._get_pool().map(_count, tasks))
+        return numpy.array([_count(task) for task in tasks])
+
+
+
+class View(object):
+    ''' Histogram drawn as bars (GL context must exist). '''
+
+    def __init__(self, histogram, color=(1.0, 1.0, 1.0, 0.5)):
+        '''
+        Parameters
+        ----------
+        histogram: Histogram
+            Histogram to be displayed, bars being updated when it changes
+
+        color: 4-floats tuple
+            Bars color
+        '''
+        self._histogram = histogram
+        self._color = color
+        self._version = None
+        n = histogram._bins
+        self._vertices = numpy.zeros(4*n, dtype=[('position', 'f4', 3)])
+        x = numpy.arange(n+1, dtype=numpy.float32)/n
+        P = self._vertices['position'].reshape(n,4,3)
+        P[:,0,0] = P[:,3,0] = x[:-1]
+        P[:,1,0] = P[:,2,0] = x[1:]
+        I = numpy.arange(0, 4*n, 4, dtype=numpy.uint32).reshape(n,1)
+        indices = (I + [0,1,2,0,2,3]).astype(numpy.uint32).reshape(-1)
+        self._buffer = VertexBuffer(self._vertices, indices)
+
+    def _update(self):
+        ''' Set bars height from histogram counts. '''
+        counts = self._histogram.counts
+        top = counts.max() or 1
+        P = self._vertices['position'].reshape(len(counts),4,3)
+        P[:,2,1] = P[:,3,1] = counts/float(top)
+        self._buffer.upload()
+        self._version = self._histogram.version
+
+    def draw(self, x, y, w, h):
+        ''' Draw histogram within given area. '''
+        if self._version != self._histogram.version:
+            self._update()
+        blit = shader.get_blit()
+        blit.bind()
+        # Unit bars are moved to the drawn area
+        blit.uniformf('quad', x, y, w-1, h-1)
+        blit.uniformf('quad_texcoord', 0, 0, 0, 0)
+        blit.uniformf('quad_depth', 0)
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        state.color(*self._color)
+        self._buffer.draw(gl.GL_TRIANGLES, 'p')
+        blit.unbind()
@@ -8,22 +8,26 @@
 #-----------------------------------------------------------------------------
 import numpy as np
 import OpenGL.GL as gl
-import texture, shader, colormap, color
+import texture, shader, colormap, color, autoscale, pyramid, stream, state
+import norm, histogram
 
 class Image(object):
     ''' '''
     def __init__(self, Z, format=None, cmap=colormap.IceAndFire, vmin=None, vmax=None,
                  interpolation='nearest', origin='lower', lighted=False, 
-                 gridsize=(0.0,0.0,0.0), elevation = 0.0):
+                 gridsize=(0.0,0.0,0.0), elevation = 0.0, streaming=False,
+                 autoscale='exact', precision=None, pyramid=None, ring=False,
+                 kernel=(1.0,0.0), norm=None):
         ''' Creates a texture from numpy array.
 
         Parameters:
         -----------
-        Z : numpy array
+        Z : numpy array or Stream
             Z may be a float32 or uint8 array with following shapes:
                 * M
                 * MxN
                 * MxNx[1,2,3,4]
+            If Z is a Stream, only current frame is read from it (see frame).
 
         format: [None | 'A' | 'LA' | 'RGB' | 'RGBA']
             Specify the texture format to use. Most of times it is possible to
@@ -44,57 +48,144 @@ class Image(object):
         origin: 'lower' or 'upper'
             Place the [0,0] index of the array in the upper left or lower left
             corner.
+
+        streaming: bool or int
+            Whether to upload data asynchronously through a ring of pixel
+            buffer objects (see Texture). This is useful for images updated at
+            each frame (camera, simulation).
+
+        autoscale: 'exact', 'sampled', 'smooth', 'percentile', 'histogram'
+                   or Autoscale
+            Policy used to compute vmin and/or vmax when they are None (see
+            glumpy.autoscale and glumpy.histogram).
+
+        precision: None, 'half' or 'float'
+            Precision hint used to store float data on the GPU (see Texture).
+
+        pyramid: None, 'mean', 'max' or 'min'
+            If given, a multi-resolution pyramid is built using given 2x2
+            reduction and the level matching the on-screen scale is used when
+            the image is displayed (see glumpy.pyramid).
+
+        ring: bool
+            If true, the array is used as a circular buffer of rows (e.g.
+            waterfall displays): rows are added using append and the oldest
+            row is always displayed first.
+
+        kernel: (B,C)
+            Mitchell-Netravali parameters of the bicubic filter: (1,0) is the
+            cubic B-spline, (1/3,1/3) the recommended filter and (0,1/2) the
+            Catmull-Rom spline.
+
+        norm: None, 'linear', 'log', 'symlog', 'power', 'equalize' or Norm
+            Normalization of float scalar data, computed in the shader before
+            colormap lookup (see glumpy.norm).
         '''
 
+        self._source = None
+        self._frame = 0
+        if isinstance(Z, stream.Stream):
+            self._source = Z
+            Z = self._source[0]
         self._lut = None
         self._interpolation = interpolation
         self._lighted = lighted
         self._gridsize = gridsize
         self._elevation = elevation
-        self._texture = texture.Texture(Z)
+        self._kernel = tuple(kernel)
+        self._texture = self._create_texture(Z, streaming, precision)
+        self._textures = [self._texture]
+        self._precision = precision
+        self._ring = ring
+        self._head = 0
+        if ring:
+            self._texture.wrap = True
         self._origin = origin
         self._vmin = vmin
         self._vmax = vmax
+        self._range = None
+        self._norm_range = None
+        self.autoscale = autoscale
+        self.norm = norm
         self._data = Z
+        self.pyramid = pyramid
         self.cmap = cmap   # This takes care of actual build
         self._shader = None
         self.build()
 
+    def _create_texture(self, Z, streaming, precision):
+        ''' Create underlying texture '''
+        return texture.Texture(Z, streaming=streaming, precision=precision)
+
     def build(self):
         ''' Build shader '''
 
         interpolation = self._interpolation
         gridsize = self._gridsize
         elevation = self._elevation
-        lighted = self._lighted
+        # Lighting relies on fixed pipeline lights
+        lighted = self._lighted and not state.core()
         cmap = self._cmap
+        normalization = None
+        if self._normalized():
+            normalization = self._norm
         self._shader = None
+        self._norm_range = None
+
+        # Bilinear and bicubic interpolation respectively need 1 and 4
+        # fetches (instead of 4 and 16) if texture can be linearly filtered
+        Bilinear, Bicubic, filter = shader.Bilinear, shader.Bicubic, 'nearest'
+        B, C = self._kernel
+        if self._texture.filterable:
+            Bilinear = shader.BilinearFast
+            # Only the B-spline can be computed from linear fetches
+            if (B, C) == (1.0, 0.0):
+                Bicubic = shader.BicubicFast
+            if (interpolation == 'bilinear' or
+                (interpolation == 'bicubic' and Bicubic is shader.BicubicFast)):
+                filter = 'linear'
+        for T in self._textures:
+            T.interpolation = filter
 
         # Source format is RGB or RGBA, no need of a colormap
         if self._texture.src_format in [gl.GL_RGB,gl.GL_RGBA]:
             if interpolation == 'bicubic':
-                self._shader = shader.Bicubic(False, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                self._shader = Bicubic(False, lighted=lighted, gridsize=gridsize, elevation=elevation, B=B, C=C)
             elif interpolation == 'bilinear':
-                self._shader = shader.Bilinear(False, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                self._shader = Bilinear(False, lighted=lighted, gridsize=gridsize, elevation=elevation)
             else:
                 self._shader = None
         # Source format is not RGB or RGBA
         else:
             if cmap:
                 if interpolation == 'bicubic':
-                    self._shader = shader.Bicubic(True, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                    self._shader = Bicubic(True, lighted=lighted, gridsize=gridsize, elevation=elevation, B=B, C=C, norm=normalization)
                 elif interpolation == 'bilinear':
-                    self._shader = shader.Bilinear(True, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                    self._shader = Bilinear(True, lighted=lighted, gridsize=gridsize, elevation=elevation, norm=normalization)
                 else:
-                    self._shader = shader.Nearest(True, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                    self._shader = shader.Nearest(True, lighted=lighted, gridsize=gridsize, elevation=elevation, norm=normalization)
             else:
                 if interpolation == 'bicubic':
-                    self._shader = shader.Bicubic(False, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                    self._shader = Bicubic(False, lighted=lighted, gridsize=gridsize, elevation=elevation, B=B, C=C, norm=normalization)
                 elif interpolation == 'bilinear':
-                    self._shader = shader.Bilinear(False, lighted=lighted, gridsize=gridsize, elevation=elevation)
+                    self._shader = Bilinear(False, lighted=lighted, gridsize=gridsize, elevation=elevation, norm=normalization)
+                elif normalization and normalization.kind:
+                    self._shader = shader.Nearest(False, lighted=lighted, gridsize=gridsize, elevation=elevation, norm=normalization)
                 else:
                     self._shader = None
-        self.update()
+
+        # Compile variants needed when interpolation or lighting is toggled
+        # during idle frames such that toggling does not stall
+        features = dict(lut=bool(cmap) and self._texture.src_format not in
+                                                [gl.GL_RGB,gl.GL_RGBA],
+                        grid=bool(gridsize[0] or gridsize[1] or gridsize[2]),
+                        height=bool(elevation),
+                        norm=normalization and normalization.kind)
+        for cls in [shader.Nearest, Bilinear, Bicubic]:
+            shader.schedule(cls, light=lighted, **features)
+            if not state.core():
+                shader.schedule(cls, light=not lighted, **features)
+        self._normalize()
 
 
     @property
@@ -107,6 +198,30 @@ class Image(object):
         ''' Underlying array '''
         return self._data
 
+    @property
+    def source(self):
+        ''' Underlying stream (None if image is not backed by a stream) '''
+        return self._source
+
+    def _get_frame(self):
+        return self._frame
+    def _set_frame(self, index):
+        if self._source is None:
+            return
+        self._frame = index
+        self._data = self._source[index]
+        self._texture.data = self._data
+        if self._pyramid:
+            self._pyramid.levels[0] = self._data
+        self.update()
+    frame = property(_get_frame, _set_frame,
+                     doc=''' Index of the displayed stream frame. ''')
+
+    @property
+    def ring(self):
+        ''' Whether array is used as a circular buffer of rows '''
+        return self._ring
+
     @property
     def texture(self):
         ''' Underlying texture '''
@@ -134,8 +249,7 @@ class Image(object):
         return self._cmap
     def _set_cmap(self, cmap):
         self._cmap = cmap
-        colors = self.cmap.LUT['rgb'][1:].flatten().view((np.float32,3))
-        self._lut = texture.Texture(colors)
+        self._lut = cmap.texture()
     cmap = property(_get_cmap, _set_cmap,
                     doc=''' Colormap to be used to represent the array. ''')
 
@@ -166,7 +280,9 @@ class Image(object):
         self._lighted = lighted
         self.build()
     lighted = property(_get_lighted, _set_lighted,
-                       doc=''' Indicate whether image is ligthed. ''')
+                       doc=''' Indicate whether image is ligthed (ignored in
+                               core profile which has no fixed pipeline
+                               lights). ''')
 
 
     def _get_interpolation(self):
@@ -177,10 +293,19 @@ class Image(object):
     interpolation = property(_get_interpolation, _set_interpolation,
                              doc=''' Interpolation method. ''')
 
+    def _get_kernel(self):
+        return self._kernel
+    def _set_kernel(self, kernel):
+        self._kernel = tuple(kernel)
+        self.build()
+    kernel = property(_get_kernel, _set_kernel,
+                      doc=''' Bicubic filter parameters (B,C). ''')
+
     def _get_vmin(self):
         return self._vmin
     def _set_vmin(self, vmin):
         self._vmin = vmin
+        self._normalize()
     vmin = property(_get_vmin, _set_vmin, 
                     doc=''' Minimal representable value. ''')
 
@@ -188,10 +313,68 @@ class Image(object):
         return self._vmax
     def _set_vmax(self, vmax):
         self._vmax = vmax
+        self._normalize()
     vmax = property(_get_vmax, _set_vmax, 
                     doc=''' Maximal representable value. ''')
 
 
+    def _get_autoscale(self):
+        return self._autoscale
+    def _set_autoscale(self, policy):
+        if policy in [None, 'exact']:
+            policy = autoscale.Autoscale()
+        elif policy == 'sampled':
+            policy = autoscale.Sampled()
+        elif policy == 'smooth':
+            policy = autoscale.Smooth()
+        elif policy == 'percentile':
+            policy = autoscale.Percentile()
+        elif policy == 'histogram':
+            policy = histogram.Histogram()
+        self._autoscale = policy
+        self._range = None
+        if hasattr(self, '_shader'):
+            self._normalize()
+    autoscale = property(_get_autoscale, _set_autoscale,
+                    doc=''' Policy used to compute vmin and/or vmax when they
+                            are None. ''')
+
+    @property
+    def histogram(self):
+        ''' Histogram of the array if autoscale policy is a Histogram (None
+            otherwise), see glumpy.histogram.View to display it. '''
+        if isinstance(self._autoscale, histogram.Histogram):
+            return self._autoscale
+        return None
+
+    def _get_norm(self):
+        return self._norm
+    def _set_norm(self, normalization):
+        self._norm = norm.get_norm(normalization)
+        if hasattr(self, '_shader'):
+            self.build()
+    norm = property(_get_norm, _set_norm,
+                    doc=''' Normalization of float scalar data. ''')
+
+    def _get_pyramid(self):
+        return self._pyramid
+    def _set_pyramid(self, method):
+        self._pyramid = None
+        self._textures = [self._texture]
+        if method and self._texture.target == gl.GL_TEXTURE_2D:
+            self._pyramid = pyramid.Pyramid(self._data, method)
+            for Z in self._pyramid.levels[1:]:
+                if len(Z.shape) == 2:
+                    Z = Z.reshape(Z.shape + (1,))
+                self._textures.append(texture.Texture(Z,
+                                      precision=self._precision,
+                                      interpolation=self._texture.interpolation))
+                if self._ring:
+                    self._textures[-1].wrap = True
+    pyramid = property(_get_pyramid, _set_pyramid,
+                    doc=''' Multi-resolution pyramid (None if the full
+                            resolution texture is always used). ''')
+
     def _get_gridsize(self):
         return self._gridsize
     def _get_gridsize_x(self):
@@ -219,34 +402,182 @@ class Image(object):
     gridsize = property(_get_gridsize, _set_gridsize, 
                     doc=''' Image grid (x,y,z). ''')
         
-    def update(self):
-        ''' Data update. '''
-        if self.vmin is None:
-            vmin = self.data.min()
-        else:
-            vmin = self.vmin
-        if self.vmax is None:
-            vmax = self._data.max()
-        else:
-            vmax = self.vmax
-        if vmin == vmax:
-            vmin, vmax = 0, 1
-        if self._lut:
-            s = self._lut.width
-            self._texture.update(bias = 1.0/(s-1)-vmin*((s-3.1)/(s-1))/(vmax-vmin),
-                                 scale = ((s-3.1)/(s-1))/(vmax-vmin))
+    def update(self, region=None):
+        ''' Data update.
+
+        Parameters:
+        -----------
+        region: None, (slice,slice) or list of (slice,slice)
+            Region(s) of the array that have been modified. Only these regions
+            are uploaded (adjacent regions being merged). If None, the whole
+            array is uploaded.
+        '''
+        self._texture.update(region)
+        self._update_pyramid(region)
+        self._autoscale.update(region)
+        self._range = None
+        self._norm_range = None
+        self._normalize()
+
+    def append(self, row):
+        ''' Append a row to a ring image.
+
+        Row replaces the oldest row of the array and only this row is
+        uploaded. Display is shifted such that the oldest row is displayed
+        first. If vmin or vmax is not set, the display range is widened to
+        include the new row but never shrinks (use update to compute it
+        again) for exact and sampled autoscale policies, while percentile
+        policies compute it again (only counting the new row for a
+        streaming histogram).
+
+        Parameters:
+        -----------
+        row: numpy array
+            New row, with shape matching the shape of an array row.
+        '''
+        if not self._ring:
+            raise ValueError('append requires a ring image (ring=True)')
+        head = self._head
+        self._data[head] = row
+        region = (slice(head,head+1),)
+        self._texture.update(region)
+        self._update_pyramid(region)
+        self._autoscale.update(region, widen=True)
+        self._head = (head+1) % self._data.shape[0]
+        self._range = None
+        self._norm_range = None
+        self._normalize()
+
+    def _update_pyramid(self, region):
+        ''' Update pyramid levels depending on modified region(s). '''
+        if not self._pyramid:
+            return
+        if region is None:
+            regions = [None]
+        elif type(region) is list:
+            regions = [self._texture._region(r) for r in region]
         else:
-            self._texture.update(bias=-vmin/(vmax-vmin),scale=1.0/(vmax-vmin))
+            regions = [self._texture._region(region)]
+        for r in regions:
+            levels = self._pyramid.update(r)
+            for T, (y0,y1,x0,x1) in zip(self._textures[1:], levels[1:]):
+                T.update((slice(y0,y1), slice(x0,x1)))
+
+    def _normalized(self):
+        ''' Whether data is normalized by the shader (scalar data). '''
+        return self._texture.src_format in [gl.GL_ALPHA,
+                                            gl.GL_LUMINANCE_ALPHA]
+
+    def _normalize(self):
+        ''' Set shader normalization such that vmin maps to 0 and vmax to 1.
+
+        Only scalar (alpha) data is normalized, RGB(A) data being displayed
+        as is. vmin and vmax are given in data units whatever the type, the
+        shader reading uint8 values back in [0,255] (see Texture.range). Since
+        normalization happens in the shader, changing vmin or vmax does not
+        require to upload data again. Normalizations depending on data
+        (histogram equalization, log floor) are updated only when data or
+        display range changes.
+        '''
+        if not self._shader:
+            return
+        bias, scale = 0.0, 1.0
+        if self._normalized():
+            vmin, vmax = self.vmin, self.vmax
+            if vmin is None or vmax is None:
+                # Range is computed only once per data update
+                if self._range is None:
+                    self._range = self._autoscale(self._data)
+                if vmin is None:
+                    vmin = self._range[0]
+                if vmax is None:
+                    vmax = self._range[1]
+            if vmin == vmax:
+                vmin, vmax = 0, 1
+            if self._norm_range != (vmin, vmax):
+                Z = self._data
+                if len(Z.shape) == 3:
+                    Z = Z[...,-1]
+                self._norm.update(Z, vmin, vmax)
+                self._norm_range = vmin, vmax
+            bias, scale = self._norm.bias_scale(vmin, vmax)
+        self._shader._bias = bias
+        self._shader._scale = scale
+
+    def _get_lut(self):
+        ''' Colormap texture, updated if colormap has been modified. '''
+        self._lut = self._cmap.texture()
+        return self._lut
 
     def blit(self, x, y, w, h):
         ''' Blit array onto active framebuffer. '''
+        T = self._texture
+        if self._pyramid:
+            size = texture.screen_size(x,y,w,h)
+            if size is not None:
+                scale = min(size[0]/T.width, size[1]/T.height)
+                T = self._textures[self._pyramid.level(scale)]
         if self._shader:
-            self._shader.bind(self.texture,self._lut)
-        if self.origin == 'lower':
-            t=0,1
-        else:
-            t=1,0
-        gl.glColor(1,1,1,1)
-        self._texture.blit(x,y,w,h,t=t)
+            self._shader.bind(T,self._get_lut())
+        state.color(1,1,1,1)
+        # Circular buffer is displayed starting from the oldest row
+        offset = self._head/float(self._data.shape[0])
+        T.blit(x,y,w,h,t=(offset,1+offset),shader=self._shader)
+        if self._shader:
+            self._shader.unbind()
+
+
+
+class TiledImage(Image):
+    ''' Image split into tiles such that arrays larger than the maximum
+    texture size can be displayed. Only visible tiles are uploaded and a
+    bounded number of tiles are kept in video memory (see TiledTexture). '''
+
+    def __init__(self, Z, format=None, cmap=colormap.IceAndFire, vmin=None, vmax=None,
+                 interpolation='nearest', origin='lower', lighted=False,
+                 gridsize=(0.0,0.0,0.0), elevation = 0.0, autoscale='sampled',
+                 precision=None, tilesize=1024, border=2, capacity=64,
+                 norm=None):
+        ''' Creates a tiled texture from numpy array.
+
+        Parameters:
+        -----------
+        tilesize: int
+            Size of the array area covered by a tile.
+
+        border: int
+            Number of pixels shared by neighbouring tiles (2 are needed for
+            bicubic interpolation to be seamless across tiles).
+
+        capacity: int
+            Maximum number of tiles kept in video memory.
+
+        See Image for other parameters. Default autoscale policy only
+        considers a subsample of the array since reading the whole array
+        would defeat the purpose of tiling.
+        '''
+        self._tilesize = tilesize
+        self._border = border
+        self._capacity = capacity
+        Image.__init__(self, Z, format=format, cmap=cmap, vmin=vmin, vmax=vmax,
+                       interpolation=interpolation, origin=origin,
+                       lighted=lighted, gridsize=gridsize, elevation=elevation,
+                       autoscale=autoscale, precision=precision, norm=norm)
+
+    def _create_texture(self, Z, streaming, precision):
+        ''' Create underlying tiled texture '''
+        return texture.TiledTexture(Z, tilesize=self._tilesize,
+                                    border=self._border,
+                                    capacity=self._capacity,
+                                    precision=precision)
+
+    def blit(self, x, y, w, h):
+        ''' Blit visible tiles onto active framebuffer. '''
+        state.color(1,1,1,1)
+        lut = self._get_lut()
+        for T, area, s, t in self._texture.tiles(x,y,w,h):
+            if self._shader:
+                self._shader.bind(T,lut)
+            T.blit(*area, s=s, t=t, shader=self._shader)
         if self._shader:
             self._shader.unbind()
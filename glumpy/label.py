@@ -34,6 +34,8 @@ Text label
 '''
 import numpy as np
 import OpenGL.GL as gl
+import state
+import shader
 import OpenGL.GLUT as glut
 from font import get_font
 from vertex_buffer import VertexBuffer
@@ -110,14 +112,36 @@ class Label(object):
 
 
     def draw(self):
-        gl.glDisable (gl.GL_TEXTURE_1D)
-        gl.glEnable( gl.GL_TEXTURE_2D )
-        gl.glDisable( gl.GL_DEPTH_TEST )
-        gl.glBindTexture( gl.GL_TEXTURE_2D, self._font.texid )
-        gl.glEnable( gl.GL_BLEND )
-        gl.glBlendFunc( gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA )
+        if state.core():
+            return self._draw_core()
+        state.active_texture(0)
+        state.disable(gl.GL_TEXTURE_1D)
+        state.enable(gl.GL_TEXTURE_2D)
+        state.disable(gl.GL_DEPTH_TEST)
+        state.bind_texture(gl.GL_TEXTURE_2D, self._font.texid)
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
         gl.glColor(1,1,1,1)
         self.buffer.draw(gl.GL_TRIANGLES)
+        # Fixed pipeline geometry drawn afterwards must not be textured
+        state.disable(gl.GL_TEXTURE_2D)
+
+    def _draw_core(self):
+        ''' Draw glyphs using blit shader (core profile). '''
+        blit = shader.get_blit(gl.GL_TEXTURE_2D)
+        blit.bind()
+        state.bind_texture(gl.GL_TEXTURE_2D, self._font.texid, unit=0)
+        blit.uniformi('texture', 0)
+        # Glyphs vertices are already positioned, quad transform is identity
+        blit.uniformf('quad', 0, 0, 0, 0)
+        blit.uniformf('quad_texcoord', 0, 0, 0, 0)
+        blit.uniformf('quad_depth', 0)
+        state.disable(gl.GL_DEPTH_TEST)
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        state.color(1,1,1,1)
+        self.buffer.draw(gl.GL_TRIANGLES)
+        blit.unbind()
 
 
     def _get_position(self):
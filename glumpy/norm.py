@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Normalizations.
+
+    A normalization maps values of a scalar array to [0,1] given the
+    (vmin,vmax) display range before colormap lookup. Non-linear
+    normalizations are computed in the fragment shader such that data is
+    uploaded as is: the shader applies the normalization transform (if any)
+    followed by the bias and scale computed here.
+
+    Histogram equalization uses the cumulative distribution of the data,
+    stored in a small texture that is only computed again when data or
+    display range changes.
+
+    Example:
+    --------
+      I = Image(Z, norm=norm.Log())
+      I = Image(Z, norm='equalize')
+'''
+import numpy
+import autoscale
+
+
+class Norm(object):
+    ''' Linear normalization. '''
+
+    # Shader variant implementing the normalization (see shader.FEATURES)
+    kind = None
+
+    # Parameter of the normalization uploaded to the shader
+    param = 0.0
+
+    def transform(self, Z):
+        ''' Transform applied (by the shader) before bias and scale. '''
+        return Z
+
+    def bias_scale(self, vmin, vmax):
+        ''' Bias and scale mapping transformed vmin to 0 and vmax to 1. '''
+        vmin, vmax = self.transform(float(vmin)), self.transform(float(vmax))
+        if vmin == vmax:
+            return 0.0, 1.0
+        scale = 1.0/(vmax-vmin)
+        return -vmin*scale, scale
+
+    def __call__(self, Z, vmin, vmax):
+        ''' Normalize Z on the CPU (as the shader does). '''
+        bias, scale = self.bias_scale(vmin, vmax)
+        return self.transform(numpy.asarray(Z, dtype=numpy.float32))*scale + bias
+
+    def update(self, Z, vmin, vmax):
+        ''' Take new data or display range into account. '''
+        pass
+
+    def texture(self):
+        ''' Texture used by the shader (None if not needed). '''
+        return None
+
+
+
+class Log(Norm):
+    ''' Logarithmic normalization, non positive values being displayed using
+        under color.
+
+    If vmin is not positive, the smallest positive value of (a subsample of)
+    the data is used instead (as matplotlib LogNorm does), or vmax/1000 if
+    data is unknown.
+    '''
+
+    kind = 'log'
+
+    def __init__(self, samples=autoscale.CHUNKSIZE):
+        '''
+        Parameters
+        ----------
+        samples: int
+            Approximate number of samples used to find the smallest positive
+            value
+        '''
+        self._samples = samples
+        self._floor = None
+
+    def transform(self, Z):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            L = numpy.log(Z)
+            if numpy.isscalar(Z):
+                return L if Z > 0 else -numpy.inf
+            L[Z <= 0] = -numpy.inf
+        return L
+
+    def update(self, Z, vmin, vmax):
+        ''' Find smallest positive value of Z if vmin is not positive. '''
+        self._floor = None
+        if vmin <= 0:
+            S = autoscale.sample(Z, self._samples)
+            with numpy.errstate(invalid='ignore'):
+                floor = numpy.where(S > 0, S, numpy.inf).min()
+            if numpy.isfinite(floor):
+                self._floor = float(floor)
+
+    def bias_scale(self, vmin, vmax):
+        if vmax <= 0:
+            # No positive values, everything is under
+            return 0.0, 1.0
+        if vmin <= 0:
+            vmin = self._floor or vmax/1000.0
+        return Norm.bias_scale(self, min(vmin, vmax), vmax)
+
+
+
+class SymLog(Norm):
+    ''' Symmetrical logarithmic normalization, linear around 0. '''
+
+    kind = 'symlog'
+
+    def __init__(self, linthresh=1.0):
+        '''
+        Parameters
+        ----------
+        linthresh: float
+            Range around 0 where the normalization is (almost) linear
+        '''
+        self.param = float(linthresh)
+
+    def transform(self, Z):
+        return numpy.sign(Z)*numpy.log1p(numpy.abs(Z)/self.param)
+
+
+
+class Power(Norm):
+    ''' Power law (gamma) normalization applied to the linear normalization,
+        negative values being left untouched. '''
+
+    kind = 'power'
+
+    def __init__(self, gamma=0.5):
+        '''
+        Parameters
+        ----------
+        gamma: float
+            Exponent
+        '''
+        self.param = float(gamma)
+
+    def __call__(self, Z, vmin, vmax):
+        T = Norm.__call__(self, Z, vmin, vmax)
+        with numpy.errstate(invalid='ignore'):
+            return numpy.where(T > 0, numpy.abs(T)**self.param, T)
+
+
+
+class Equalize(Norm):
+    ''' Histogram equalization over the display range. '''
+
+    kind = 'equalize'
+
+    def __init__(self, bins=256, samples=autoscale.CHUNKSIZE):
+        '''
+        Parameters
+        ----------
+        bins: int
+            Number of histogram bins (size of the distribution texture)
+
+        samples: int
+            Approximate number of samples used to compute the histogram
+        '''
+        self._bins = bins
+        self._samples = samples
+        self._cdf = numpy.linspace(0, 1, bins+1).astype(numpy.float32)
+        self._texture = None
+        self._dirty = True
+
+    @property
+    def cdf(self):
+        ''' Cumulative distribution at bins edges (normalized to [0,1]). '''
+        return self._cdf
+
+    def update(self, Z, vmin, vmax):
+        ''' Compute distribution of Z values within [vmin,vmax]. '''
+        if vmin >= vmax:
+            return
+        S = autoscale.sample(Z, self._samples)
+        with numpy.errstate(invalid='ignore'):
+            counts, edges = numpy.histogram(S, self._bins, range=(vmin,vmax))
+        total = counts.sum()
+        if not total:
+            return
+        self._cdf[0] = 0.0
+        numpy.cumsum(counts, out=self._cdf[1:])
+        self._cdf /= total
+        self._dirty = True
+
+    def __call__(self, Z, vmin, vmax):
+        T = Norm.__call__(self, Z, vmin, vmax)
+        with numpy.errstate(invalid='ignore'):
+            inside = (T >= 0) & (T <= 1)
+        T[inside] = numpy.interp(T[inside], numpy.linspace(0, 1, self._bins+1),
+                                 self._cdf)
+        return T
+
+    def texture(self):
+        ''' Linearly interpolated texture of the distribution, updated if the
+            distribution has been computed again. '''
+
+        import texture
+        if self._texture is None:
+            self._texture = texture.Texture(self._cdf, precision='fixed',
+                                            interpolation='linear')
+        elif self._dirty:
+            self._texture.update()
+        self._dirty = False
+        return self._texture
+
+
+
+# Normalizations indexed by name
+_norms = { 'linear'   : Norm,
+           'log'      : Log,
+           'symlog'   : SymLog,
+           'power'    : Power,
+           'equalize' : Equalize }
+
+def get_norm(norm):
+    ''' Normalization from name, class or instance (None for linear). '''
+
+    if norm is None:
+        return Norm()
+    if isinstance(norm, basestring):
+        if norm not in _norms:
+            raise ValueError('Unknown normalization %s' % norm)
+        return _norms[norm]()
+    if isinstance(norm, type):
+        return norm()
+    return norm
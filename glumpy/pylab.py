@@ -83,8 +83,8 @@ def show(interpolation='nearest'):
     frame = glumpy.Image(Ft,interpolation=interpolation)
     frame.update()
 
-    gl.glEnable(gl.GL_BLEND)
-    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+    glumpy.state.enable(gl.GL_BLEND)
+    glumpy.state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
 
     @window.event
     def on_resize(width,height):
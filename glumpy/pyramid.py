@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Multi-resolution pyramid.
+
+    A pyramid holds successive 2x2 reductions of an array such that a large
+    array can be displayed at low zoom using an appropriate level of detail
+    instead of sampling the full resolution array. Reductions may use the
+    mean (smooth), the max or the min (features are preserved whatever the
+    zoom level, which is often what matters for scientific data).
+
+    Example:
+    --------
+      P = Pyramid(Z, method='max')
+      Z[100:110,100:110] = 1
+      P.update((100,110,100,110))
+'''
+import math
+import numpy
+
+_reductions = { 'mean' : numpy.mean,
+                'max'  : numpy.max,
+                'min'  : numpy.min }
+
+
+def downsample(Z, method='mean'):
+    ''' Reduce Z by a factor of 2 along the first two axes.
+
+    Odd sizes are handled by replicating the last row (or column) such that
+    the reduced array has shape ceil(M/2) x ceil(N/2).
+
+    Parameters
+    ----------
+    Z: numpy array
+        Array to be reduced (at least 2D)
+
+    method: 'mean', 'max' or 'min'
+        Reduction used over each 2x2 block
+    '''
+    if method not in _reductions:
+        raise ValueError('Unknown reduction method %s' % str(method))
+    M, N = Z.shape[:2]
+    if M % 2 or N % 2:
+        pad = [(0, M % 2), (0, N % 2)] + [(0, 0)]*(Z.ndim-2)
+        Z = numpy.pad(Z, pad, mode='edge')
+        M, N = Z.shape[:2]
+    blocks = Z.reshape((M//2, 2, N//2, 2) + Z.shape[2:])
+    R = _reductions[method](blocks, axis=(1,3))
+    if R.dtype != Z.dtype:
+        if Z.dtype.kind in 'ui':
+            R = numpy.round(R)
+        R = R.astype(Z.dtype)
+    return R
+
+
+
+class Pyramid(object):
+    ''' Multi-resolution pyramid of an array. '''
+
+    def __init__(self, Z, method='mean', levels=None):
+        '''
+        Parameters
+        ----------
+        Z: numpy array
+            Full resolution array (at least 2D), level 0 of the pyramid
+
+        method: 'mean', 'max' or 'min'
+            Reduction used to build a level from the previous one
+
+        levels: int or None
+            Maximum number of levels (None means until one of the first two
+            dimensions cannot be reduced anymore)
+        '''
+        if method not in _reductions:
+            raise ValueError('Unknown reduction method %s' % str(method))
+        self._method = method
+        self._levels = [Z]
+        while min(Z.shape[:2]) >= 2 and (levels is None or
+                                          len(self._levels) < levels):
+            Z = downsample(Z, method)
+            self._levels.append(Z)
+
+    @property
+    def method(self):
+        ''' Reduction method. '''
+        return self._method
+
+    @property
+    def levels(self):
+        ''' List of levels, from full resolution to coarsest. '''
+        return self._levels
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __getitem__(self, key):
+        return self._levels[key]
+
+    def level(self, scale):
+        ''' Level to be used when full resolution array is displayed using
+            given scale (number of screen pixels per array item). '''
+
+        if scale <= 0:
+            return len(self._levels)-1
+        if scale >= 1:
+            return 0
+        level = int(math.floor(math.log(1.0/scale, 2)))
+        return min(level, len(self._levels)-1)
+
+    def update(self, region=None):
+        ''' Update levels after level 0 has been modified.
+
+        Only the part of each level depending on the modified region is
+        computed again.
+
+        Parameters
+        ----------
+        region: None or (y0,y1,x0,x1)
+            Region of level 0 that has been modified (None means whole array)
+
+        Returns
+        -------
+        List of modified regions (y0,y1,x0,x1), one per level.
+        '''
+        if region is None:
+            M, N = self._levels[0].shape[:2]
+            region = 0, M, 0, N
+        regions = [region]
+        for k in range(1, len(self._levels)):
+            y0, y1, x0, x1 = regions[-1]
+            if y1 <= y0 or x1 <= x0:
+                regions.append(regions[-1])
+                continue
+            # Align region on 2x2 blocks of previous level
+            y0, y1, x0, x1 = y0//2, (y1+1)//2, x0//2, (x1+1)//2
+            Z = self._levels[k-1][2*y0:2*y1, 2*x0:2*x1]
+            self._levels[k][y0:y1, x0:x1] = downsample(Z, self._method)
+            regions.append((y0, y1, x0, x1))
+        return regions
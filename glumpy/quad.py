@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Unit quad.
+
+    Textures and frames are drawn using a single unit quad kept in video
+    memory (and recorded in a vertex array object when available, which is
+    always the case in core profile) that is moved to the drawn area by the
+    vertex shader (see shader/quad.txt), such that drawing a quad is one bind
+    and one draw call instead of a glBegin/glEnd block.
+
+    Example:
+    --------
+      shader = glumpy.shader.get_blit()
+      shader.bind()
+      quad.draw(shader, 0, 0, 100, 100)
+      shader.unbind()
+'''
+import numpy
+import OpenGL.GL as gl
+import state
+
+_vertices = numpy.array([(0,0), (1,0), (1,1), (0,1)], dtype=numpy.float32)
+_buffer = None
+_array = None
+
+
+def _forget():
+    ''' Forget quad buffer and vertex array of previous context. '''
+    global _buffer, _array
+    _buffer, _array = None, None
+
+state.on_new_context(_forget)
+
+
+def _build():
+    ''' Upload quad and record vertex arrays setup. '''
+
+    global _buffer, _array
+    _buffer = gl.glGenBuffers(1)
+    state.bind_buffer(gl.GL_ARRAY_BUFFER, _buffer)
+    gl.glBufferData(gl.GL_ARRAY_BUFFER, _vertices, gl.GL_STATIC_DRAW)
+    state.bind_buffer(gl.GL_ARRAY_BUFFER, 0)
+    if bool(gl.glGenVertexArrays):
+        _array = gl.glGenVertexArrays(1)
+        state.bind_vertex_array(_array)
+        _attach()
+        state.bind_vertex_array(0)
+
+
+def _attach():
+    ''' Source vertices and texture coordinates from quad buffer. '''
+
+    state.bind_buffer(gl.GL_ARRAY_BUFFER, _buffer)
+    if state.core():
+        for index in [state.POSITION, state.TEXCOORD]:
+            gl.glEnableVertexAttribArray(index)
+            gl.glVertexAttribPointer(index, 2, gl.GL_FLOAT, False, 0, None)
+    else:
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, 0, None)
+        gl.glTexCoordPointer(2, gl.GL_FLOAT, 0, None)
+    state.bind_buffer(gl.GL_ARRAY_BUFFER, 0)
+
+
+def _detach():
+    ''' Restore client vertex arrays state. '''
+
+    gl.glDisableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+    gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+
+def draw(shader, x, y, w, h, z=0, s=(0,1), t=(0,1), mode=gl.GL_TRIANGLE_FAN):
+    ''' Draw quad covering given area using given (bound) shader.
+
+    s gives texture coordinates of left and right edges while t gives
+    texture coordinates of top and bottom edges. Vertices are given
+    counterclockwise from bottom left corner such that mode can also be
+    GL_LINE_LOOP.
+    '''
+
+    if _buffer is None:
+        _build()
+    shader.uniformf('quad', x, y, w-1.0, h-1.0)
+    shader.uniformf('quad_texcoord', s[0], t[1], s[1]-s[0]-1.0, t[0]-t[1]-1.0)
+    shader.uniformf('quad_depth', z)
+    if _array:
+        state.bind_vertex_array(_array)
+        gl.glDrawArrays(mode, 0, 4)
+        state.bind_vertex_array(0)
+    else:
+        _attach()
+        gl.glDrawArrays(mode, 0, 4)
+        _detach()
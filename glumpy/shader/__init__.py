@@ -39,7 +39,10 @@
     that is in the corresponding space, even if it is occluded; the Z-buffer
     sorts this out later.)
 '''
-from shader import Shader
+from shader import Shader, enable_binary_cache, disable_binary_cache
+from shader import preprocess, translate, schedule, compile_pending
+from shader import on_schedule
 from nearest import Nearest
-from bilinear import Bilinear
-from bicubic import Bicubic
+from bilinear import Bilinear, BilinearFast
+from bicubic import Bicubic, BicubicFast
+from blit import Blit, get_blit
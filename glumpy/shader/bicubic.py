@@ -6,103 +6,116 @@
 # Distributed under the terms of the BSD License. The full license is in
 # the file COPYING, distributed as part of this software.
 # -----------------------------------------------------------------------------
-import math
-import ctypes
+import numpy
 import OpenGL.GL as gl
-from shader import Shader, read_shader
+from .. import state
+from OpenGL.GL.ARB.texture_float import *
+from shader import Shader
 
+# Kernel textures indexed by (B, C, size)
+_kernels = {}
 
-def build_kernel(size=256):
+
+def mitchell_netravali(x, B=1.0, C=0.0):
     # From GPU Gems
     # Chapter 24. High-Quality Filtering
     # Kevin Bjorke, NVIDIA
     # http://http.developer.nvidia.com/GPUGems/gpugems_ch24.html
     #
     # Mitchell Netravali Reconstruction Filter
-    # a = 1.0, b = 0.0  - cubic B-spline
-    # B = 1/3, b = 1/3  - recommended
-    # a = 0.5, b = 0.0  - Catmull-Rom spline
-    def MitchellNetravali(x, a=1, b=0):
-        x = math.fabs(x)
-        if x < 1.0:
-            return ((12-9*a-6*b) *x*x*x + (-18+12*a+6*b)*x*x + (6-2*a))/6.0
-        elif x < 2.0:
-            return ((-a-6*b)*x*x*x + (6*a+30*b)*x*x + (-12*a-48*b)*x + (8*a+24*b))/6.0
-        else:
-            return 0
-    
-    data = (gl.GLfloat*(4*size))()
-    for i in range(size):
-        x = i/float(size-1)
-        data[i*4+0] = MitchellNetravali(x+1)
-        data[i*4+1] = MitchellNetravali(x)
-        data[i*4+2] = MitchellNetravali(1-x)
-        data[i*4+3] = MitchellNetravali(2-x)
-    texid = gl.GLuint()
-    gl.glGenTextures(1, ctypes.byref(texid))
-    kernel = texid.value
+    # B = 1,   C = 0   - cubic B-spline
+    # B = 1/3, C = 1/3 - recommended
+    # B = 0,   C = 1/2 - Catmull-Rom spline
+    x = numpy.abs(x)
+    near = ((12-9*B-6*C)*x**3 + (-18+12*B+6*C)*x**2 + (6-2*B))/6.0
+    far = ((-B-6*C)*x**3 + (6*B+30*C)*x**2 + (-12*B-48*C)*x + (8*B+24*C))/6.0
+    return numpy.where(x < 1.0, near, numpy.where(x < 2.0, far, 0.0))
+
+
+def build_kernel(size=256, B=1.0, C=0.0):
+    ''' Build a new 1D texture holding the 4 filter weights for size
+        fractional positions. '''
+
+    x = numpy.linspace(0.0, 1.0, size)
+    data = numpy.array([mitchell_netravali(x+1, B, C),
+                        mitchell_netravali(x, B, C),
+                        mitchell_netravali(1-x, B, C),
+                        mitchell_netravali(2-x, B, C)], dtype=numpy.float32)
+    data = numpy.ascontiguousarray(data.T)
+    # Weights are negative for C > 0 and would be clamped by a normalized
+    # format
+    format = gl.GL_RGBA16
+    if state.core() or glInitTextureFloatARB():
+        format = GL_RGBA32F_ARB
+    kernel = gl.glGenTextures(1)
     gl.glPixelStorei (gl.GL_UNPACK_ALIGNMENT, 1)
     gl.glPixelStorei (gl.GL_PACK_ALIGNMENT, 1)
-    gl.glBindTexture (gl.GL_TEXTURE_1D, texid)
+    state.bind_texture(gl.GL_TEXTURE_1D, kernel)
     gl.glTexParameterf (gl.GL_TEXTURE_1D,
                         gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
     gl.glTexParameterf (gl.GL_TEXTURE_1D,
                         gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
     gl.glTexParameterf (gl.GL_TEXTURE_1D,
-                        gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP)
+                        gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
     gl.glTexParameterf (gl.GL_TEXTURE_1D,
-                        gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP)
-    gl.glTexImage1D (gl.GL_TEXTURE_1D,  0, gl.GL_RGBA16, size, 0,
+                        gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+    gl.glTexImage1D (gl.GL_TEXTURE_1D,  0, format, size, 0,
                      gl.GL_RGBA, gl.GL_FLOAT, data)
     return kernel
 
 
+def get_kernel(B=1.0, C=0.0, size=256):
+    ''' Get kernel texture for given parameters, textures are built only once
+        and shared by all bicubic shaders. '''
+
+    key = float(B), float(C), int(size)
+    if key not in _kernels:
+        _kernels[key] = build_kernel(size, B, C)
+    return _kernels[key]
+
+state.on_new_context(_kernels.clear)
+
+
 class Bicubic(Shader):
-    def __init__(self, use_lut=False, lighted=False, gridsize=(0.0,0.0,0.0), elevation=0.0):
+    vertex_files = ['bicubic.txt', 'vertex_bicubic.txt']
+    fragment_files = ['bicubic.txt', 'fragment_bicubic.txt']
+
+    def __init__(self, use_lut=False, lighted=False, gridsize=(0.0,0.0,0.0), elevation=0.0,
+                 B=1.0, C=0.0, norm=None):
+        ''' B and C are the Mitchell-Netravali filter parameters, (1,0) being
+            the cubic B-spline, (1/3,1/3) the recommended filter and (0,1/2)
+            the Catmull-Rom spline. They can be changed at any time. '''
+        self.B, self.C = B, C
         self._lighted = lighted
         self._gridsize = gridsize
         self._gridwidth = (1.0,1.0,1.0)
         self._elevation = elevation
-        interpolation = read_shader('bicubic.txt')
-        if lighted:
-            light     = read_shader('phong.txt')
-        else:
-            light     = ''
-        lut           = read_shader('lut.txt')
-        vertex        = read_shader('vertex_bicubic.txt')
-        fragment      = read_shader('fragment_bicubic.txt')
-        lut_code = light_code = grid_code = height_code = ''
-        if use_lut:
-            lut_code = 'color = texture1D_lut(lut, color.a);'
-        if lighted:
-            light_code = read_shader('light_bicubic.txt')
-        if self._gridsize[0] or self._gridsize[1] or self._gridsize[2]:
-            grid_code = read_shader('grid.txt')
-        if self._elevation:
-            height_code = read_shader('height_bicubic.txt')
-        fragment  = fragment % (lut_code,grid_code,light_code)
-        vertex    = vertex % (height_code)
-        Shader.__init__(self,
-          vert = [interpolation] + [vertex],
-          frag = [interpolation] + [light] + [lut] + [fragment])
-        self.kernel = build_kernel()
+        self._bias = 0.0
+        self._scale = 1.0
+        self._norm = norm
+        grid = gridsize[0] or gridsize[1] or gridsize[2]
+        vert, frag = self.sources(lut=use_lut, light=lighted,
+                                  grid=bool(grid), height=bool(elevation),
+                                  norm=norm and norm.kind)
+        Shader.__init__(self, vert, frag)
 
     def bind(self, texture, lut=None):
         ''' Bind the program, i.e. use it. '''
-        Shader.bind(self)
-        gl.glActiveTexture(gl.GL_TEXTURE2)
-        gl.glBindTexture(gl.GL_TEXTURE_1D, self.kernel)
+        self.bind_image(texture, lut)
+        self.kernel = get_kernel(self.B, self.C)
+        state.bind_texture(gl.GL_TEXTURE_1D, self.kernel, unit=2)
         self.uniformi('kernel', 2)
-        if lut is not None:
-            gl.glActiveTexture(gl.GL_TEXTURE1)
-            gl.glBindTexture(lut.target, lut.id)
-            self.uniformi('lut', 1)
-        gl.glEnable(texture.target)
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        gl.glBindTexture(texture.target, texture.id)
-        self.uniformi('texture', 0)
-        self.uniformf('elevation', self._elevation)
-        self.uniformf('pixel', 1.0/texture.width, 1.0/texture.height)
-        self.uniformf('gridsize', *self._gridsize)
-        self.uniformf('gridwidth', *self._gridwidth)
-        self.uniformi('lighted', self._lighted)
+
+
+
+class BicubicFast(Bicubic):
+    ''' Bicubic (B-spline) interpolation using 4 linearly filtered fetches
+        instead of 16 fetches. Texture must use linear interpolation and B, C
+        are ignored (always 1, 0). '''
+
+    vertex_files = ['bicubic_fast.txt', 'vertex_bicubic.txt']
+    fragment_files = ['bicubic_fast.txt', 'fragment_bicubic.txt']
+
+    def bind(self, texture, lut=None):
+        ''' Bind the program, i.e. use it (no kernel texture needed). '''
+        self.bind_image(texture, lut)
@@ -6,53 +6,38 @@
 # Distributed under the terms of the BSD License. The full license is in
 # the file COPYING, distributed as part of this software.
 # -----------------------------------------------------------------------------
-from shader import Shader, read_shader
-import OpenGL.GL as gl
+from shader import Shader
 
 
 class Bilinear(Shader):
-    def __init__(self, use_lut=False, lighted=False, gridsize=(0.0,0.0,0.0), elevation=0.0):
+    vertex_files = ['bilinear.txt', 'vertex.txt']
+    fragment_files = ['bilinear.txt', 'fragment.txt']
+
+    def __init__(self, use_lut=False, lighted=False, gridsize=(0.0,0.0,0.0), elevation=0.0,
+                 norm=None):
         self._lighted = lighted
         self._gridsize = gridsize
         self._gridwidth = (1.0,1.0,1.0)
         self._elevation = elevation
-        interpolation = read_shader('bilinear.txt')
-        #if lighted:
-        light     = read_shader('phong.txt')
-        #else:
-        #    light     = ' '
-        lut           = read_shader('lut.txt')
-        vertex        = read_shader('vertex.txt')
-        fragment      = read_shader('fragment.txt')
-        lut_code = light_code = grid_code = height_code = ''
-        if use_lut:
-            lut_code = 'color = texture1D_lut(lut, color.a);'
-        if lighted:
-            light_code = read_shader('light.txt')
-        if self._gridsize[0] or self._gridsize[1] or self._gridsize[2]:
-            grid_code = read_shader('grid.txt')
-        if self._elevation:
-            height_code = read_shader('height.txt')
-        fragment  = fragment % (lut_code,grid_code,light_code)
-        vertex    = vertex % (height_code)
-        Shader.__init__(self,
-          vert = [interpolation] + [vertex],
-          frag = [interpolation] + [light] + [lut] + [fragment])
+        self._bias = 0.0
+        self._scale = 1.0
+        self._norm = norm
+        grid = gridsize[0] or gridsize[1] or gridsize[2]
+        vert, frag = self.sources(lut=use_lut, light=lighted,
+                                  grid=bool(grid), height=bool(elevation),
+                                  norm=norm and norm.kind)
+        Shader.__init__(self, vert, frag)
 
 
     def bind(self, texture, lut=None):
         ''' Bind the program, i.e. use it. '''
-        Shader.bind(self)
-        if lut is not None:
-            gl.glActiveTexture(gl.GL_TEXTURE1)
-            gl.glBindTexture(lut.target, lut.id)
-            self.uniformi('lut', 1)
-        gl.glEnable(texture.target)
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        gl.glBindTexture(texture.target, texture.id)
-        self.uniformi('texture', 0)
-        self.uniformf('elevation', self._elevation)
-        self.uniformf('pixel', 1.0/texture.width, 1.0/texture.height)
-        self.uniformf('gridsize', *self._gridsize)
-        self.uniformf('gridwidth', *self._gridwidth)
-        self.uniformi('lighted', self._lighted)
+        self.bind_image(texture, lut)
+
+
+
+class BilinearFast(Bilinear):
+    ''' Bilinear interpolation using a single linearly filtered fetch instead
+        of 4 fetches. Texture must use linear interpolation. '''
+
+    vertex_files = ['linear.txt', 'vertex.txt']
+    fragment_files = ['linear.txt', 'fragment.txt']
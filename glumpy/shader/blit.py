@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Blit shaders (plain colored or textured quads) '''
+from shader import Shader
+import OpenGL.GL as gl
+from .. import state
+
+
+class Blit(Shader):
+    ''' Current color, modulated by a 1D or 2D texture if any, such that
+        quads are drawn as the fixed pipeline would. '''
+
+    vertex_files = ['vertex_blit.txt']
+    fragment_files = ['fragment_blit.txt']
+    features = ['texture_1d', 'texture_2d']
+    exclusive = [['texture_1d', 'texture_2d']]
+
+    def __init__(self, target=None):
+        self.target = target
+        vert, frag = self.sources(texture_1d=(target == gl.GL_TEXTURE_1D),
+                                  texture_2d=(target == gl.GL_TEXTURE_2D))
+        Shader.__init__(self, vert, frag)
+
+    def bind(self, texture=None):
+        ''' Bind the program and texture (if any). '''
+        Shader.bind(self)
+        if texture is not None:
+            state.bind_texture(texture.target, texture.id, unit=0)
+            self.uniformi('texture', 0)
+
+
+# Blit shaders indexed by texture target
+_shaders = {}
+
+def get_blit(target=None):
+    ''' Shared blit shader for given texture target (None for no texture). '''
+
+    if target not in _shaders:
+        _shaders[target] = Blit(target)
+    return _shaders[target]
+
+state.on_new_context(_shaders.clear)
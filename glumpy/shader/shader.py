@@ -28,36 +28,175 @@
     shader.uniformi('texture', 0)
     shader.uniformf('pixel', 1.0/texture.width, 1.0/texture.height)
 
-    texture.blit(x,y,w,h)
+    texture.blit(x,y,w,h,shader=shader)
     shader.unbind()
 '''
 import os
+import re
+import struct
+import itertools
+import hashlib
 import OpenGL.GL as gl
+from .. import state
+from OpenGL.GL.ARB.get_program_binary import *
 import ctypes
 
+# Linked programs (handle, uniforms, attributes, uniform types and last
+# uploaded uniform values) shared by all shaders built from the same class and
+# sources
+_programs = {}
+
+# Uniform types set using integer functions
+_int_types = [gl.GL_INT, gl.GL_INT_VEC2, gl.GL_INT_VEC3, gl.GL_INT_VEC4,
+              gl.GL_BOOL, gl.GL_BOOL_VEC2, gl.GL_BOOL_VEC3, gl.GL_BOOL_VEC4,
+              gl.GL_SAMPLER_1D, gl.GL_SAMPLER_2D, gl.GL_SAMPLER_3D,
+              gl.GL_SAMPLER_CUBE, gl.GL_SAMPLER_1D_SHADOW,
+              gl.GL_SAMPLER_2D_SHADOW]
+
+# Shader sources indexed by filename
+_sources = {}
+
+# Variants (class, features) waiting to be compiled
+_pending = []
+
+# Function called when variants get scheduled while none are pending
+_on_schedule = None
+
+# Feature flags, each one is turned into a preprocessor define
+FEATURES = ['lut', 'light', 'grid', 'height',
+            'norm_log', 'norm_symlog', 'norm_power', 'norm_equalize']
+
+# Groups of mutually exclusive feature flags (at most one is turned on)
+EXCLUSIVE = [['norm_log', 'norm_symlog', 'norm_power', 'norm_equalize']]
+
+_include = re.compile(r'^\s*#include\s+"([^"]+)"')
+
+# Translation of GLSL 1.10 sources (compatibility profile) to GLSL 3.30 core
+# sources: built-in attributes, varyings and matrices are replaced with
+# explicit ones (see state for attribute locations and matrices) and the
+# texture sampler is renamed since it would hide the texture() function.
+_core_headers = {
+    'vertex' : '\n'.join([
+        '#version 330 core',
+        'layout(location = 0) in vec4 in_position;',
+        'layout(location = 1) in vec4 in_color;',
+        'layout(location = 2) in vec3 in_normal;',
+        'layout(location = 3) in vec4 in_texcoord;',
+        'uniform mat4 projection;',
+        'uniform mat4 modelview;',
+        'out vec4 v_color;',
+        'out vec4 v_texcoord;']),
+    'fragment' : '\n'.join([
+        '#version 330 core',
+        'in vec4 v_color;',
+        'in vec4 v_texcoord;',
+        'out vec4 frag_color;']) }
+_core_names = {
+    'vertex' : [
+        (r'\bgl_Vertex\b', 'in_position'),
+        (r'\bgl_Color\b', 'in_color'),
+        (r'\bgl_Normal\b', 'in_normal'),
+        (r'\bgl_MultiTexCoord0\b', 'in_texcoord'),
+        (r'\bgl_FrontColor\b', 'v_color'),
+        (r'\bgl_ModelViewProjectionMatrix\b', '(projection*modelview)'),
+        (r'\bvarying\b', 'out'),
+        (r'\battribute\b', 'in') ],
+    'fragment' : [
+        (r'\bgl_Color\b', 'v_color'),
+        (r'\bgl_FragColor\b', 'frag_color'),
+        (r'\bvarying\b', 'in') ] }
+_core_common_names = [
+    (r'\bgl_TexCoord\[0\]', 'v_texcoord'),
+    (r'\btexture\b', 'texture_'),
+    (r'\btexture[123]D\b', 'texture') ]
+
+# Uniforms renamed by translation, indexed by translated name
+_core_uniforms = { 'texture_' : 'texture' }
+
+# Directory where linked program binaries are stored (None if disabled)
+_binary_cache = os.environ.get('GLUMPY_SHADER_CACHE', None)
+_has_program_binary = None
+
+
+def enable_binary_cache(path=None):
+    ''' Store linked programs on disk such that next runs do not have to
+        compile them again.
+
+    Binaries are only valid for a given driver and are thus indexed by
+    sources and driver vendor, renderer and version. A binary rejected by the
+    driver is removed and the program is compiled from sources. The cache can
+    also be enabled by setting the GLUMPY_SHADER_CACHE environment variable to
+    the cache directory.
+
+    Parameters
+    ----------
+    path: str or None
+        Cache directory (default is glumpy directory within user cache
+        directory)
+    '''
+    global _binary_cache
+    if path is None:
+        path = os.environ.get('XDG_CACHE_HOME',
+                              os.path.join(os.path.expanduser('~'), '.cache'))
+        path = os.path.join(path, 'glumpy')
+    _binary_cache = path
+
+
+def disable_binary_cache():
+    ''' Do not use on-disk program binaries anymore. '''
+    global _binary_cache
+    _binary_cache = None
+
+
 class Shader:
     ''' Base shader class. '''
 
     def __init__(self, vert = None, frag = None, name=''):
         ''' vert, frag and geom take arrays of source strings
-            the arrays will be concatenated into one string by OpenGL.'''
+            the arrays will be concatenated into one string by OpenGL.
+
+            Shaders of the same class built from the same sources share a
+            single linked program, such that only per-instance state (set at
+            bind time) differs between them.'''
 
         self.uniforms = {}
+        self.attributes = {}
+        self.uniform_types = {}
+        self._values = {}
         self.name = name
+        self._vert = '\n'.join(vert).split('\n')
+        self._frag = '\n'.join(frag).split('\n')
+        digest = hashlib.sha1('\n'.join(vert) + '\0' + '\n'.join(frag))
+        self._key = (name or self.__class__.__name__, digest.hexdigest())
+        if self._key in _programs:
+            (self.handle, self.uniforms, self.attributes,
+             self.uniform_types, self._values) = _programs[self._key]
+            self.linked = True
+            return
         # create the program handle
         self.handle = gl.glCreateProgram()
         # we are not linked yet
         self.linked = False
+        # try a binary from a previous run
+        binary = self._binary_path()
+        if binary and self._load_binary(binary):
+            self._introspect()
+            return
         # create the vertex shader
         self._build_shader(vert, gl.GL_VERTEX_SHADER)
-        self._vert = '\n'.join(vert).split('\n')
         # create the fragment shader
         self._build_shader(frag, gl.GL_FRAGMENT_SHADER)
-        self._frag = '\n'.join(frag).split('\n')
         # the geometry shader will be the same, once pyglet supports the
         # extension self.createShader(frag, GL_GEOMETRY_SHADER_EXT) attempt to
         # link the program
+        if binary:
+            glProgramParameteri(self.handle,
+                                GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
         self._link()
+        if self.linked:
+            self._introspect()
+            if binary:
+                self._save_binary(binary)
 
     def _build_shader(self, strings, stype):
         ''' Actual building of the shader '''
@@ -110,21 +249,225 @@ class Shader:
             # all is well, so we are linked
             self.linked = True
 
+    # Source files of vertex and fragment shaders (set by subclasses)
+    vertex_files = []
+    fragment_files = []
+    # Feature flags supported by these sources
+    features = FEATURES
+    exclusive = EXCLUSIVE
+
+    @classmethod
+    def sources(cls, **features):
+        ''' Vertex and fragment sources of the variant with given features
+            (see features) turned on. The norm feature gives the kind of
+            normalization (see glumpy.norm), if any. '''
+
+        norm = features.get('norm')
+        if norm:
+            features = dict(features, **{'norm_'+norm: True})
+        defines = dict((name.upper(), 1)
+                       for name in cls.features if features.get(name))
+        vert = preprocess(cls.vertex_files, defines)
+        frag = preprocess(cls.fragment_files, defines)
+        if state.core():
+            vert, frag = translate(vert, 'vertex'), translate(frag, 'fragment')
+        return [vert], [frag]
+
+    @classmethod
+    def variants(cls):
+        ''' Enumerate features of all possible variants, i.e. combinations
+            of independent flags with at most one flag of each exclusive
+            group. '''
+
+        grouped = sum(cls.exclusive, [])
+        independent = [name for name in cls.features if name not in grouped]
+        choices = [[None] + group for group in cls.exclusive]
+        for flags in itertools.product([False, True],
+                                       repeat=len(independent)):
+            for chosen in itertools.product(*choices):
+                features = dict(zip(independent, flags))
+                for group, name in zip(cls.exclusive, chosen):
+                    for other in group:
+                        features[other] = (other == name)
+                yield features
+
+    @classmethod
+    def precompile(cls, **features):
+        ''' Compile (and cache) the variant with given features. '''
+
+        vert, frag = cls.sources(**features)
+        Shader(vert, frag, name=cls.__name__)
+
+    def _introspect(self):
+        ''' Find active uniforms and attributes of the linked program '''
+
+        count = ctypes.c_int(0)
+        gl.glGetProgramiv(self.handle, gl.GL_ACTIVE_UNIFORMS, ctypes.byref(count))
+        for i in range(count.value):
+            name, size, type = gl.glGetActiveUniform(self.handle, i)
+            name = name.split('[')[0]
+            location = gl.glGetUniformLocation(self.handle, name)
+            name = _core_uniforms.get(name, name)
+            self.uniforms[name] = location
+            self.uniform_types[name] = type
+        gl.glGetProgramiv(self.handle, gl.GL_ACTIVE_ATTRIBUTES, ctypes.byref(count))
+        buffer = ctypes.create_string_buffer(256)
+        length, size, type = ctypes.c_int(0), ctypes.c_int(0), ctypes.c_uint(0)
+        for i in range(count.value):
+            gl.glGetActiveAttrib(self.handle, i, 256, ctypes.byref(length),
+                                 ctypes.byref(size), ctypes.byref(type), buffer)
+            name = buffer.value
+            if not name.startswith('gl_'):
+                self.attributes[name] = gl.glGetAttribLocation(self.handle, name)
+        _programs[self._key] = (self.handle, self.uniforms, self.attributes,
+                                self.uniform_types, self._values)
+
+    def _binary_path(self):
+        ''' Path of the program binary in the on-disk cache (None if cache is
+            disabled or binaries are not supported). '''
+
+        global _has_program_binary
+        if _binary_cache is None:
+            return None
+        if _has_program_binary is None:
+            _has_program_binary = bool(glInitGetProgramBinaryARB())
+        if not _has_program_binary:
+            return None
+        driver = [gl.glGetString(name) or '' for name in
+                  (gl.GL_VENDOR, gl.GL_RENDERER, gl.GL_VERSION)]
+        digest = hashlib.sha1('\0'.join(list(self._key) + driver))
+        return os.path.join(_binary_cache, digest.hexdigest() + '.bin')
+
+    def _load_binary(self, path):
+        ''' Load program binary, return whether program is linked. '''
+
+        try:
+            fid = open(path, 'rb')
+            data = fid.read()
+            fid.close()
+            format, = struct.unpack('<I', data[:4])
+        except (IOError, struct.error):
+            return False
+        binary = data[4:]
+        glProgramBinary(self.handle, format, binary, len(binary))
+        temp = ctypes.c_int(0)
+        gl.glGetProgramiv(self.handle, gl.GL_LINK_STATUS, ctypes.byref(temp))
+        if not temp:
+            # driver rejected the binary, it will be compiled from sources
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return False
+        self.linked = True
+        return True
+
+    def _save_binary(self, path):
+        ''' Save linked program binary. '''
+
+        length = ctypes.c_int(0)
+        gl.glGetProgramiv(self.handle,
+                          GL_PROGRAM_BINARY_LENGTH, ctypes.byref(length))
+        if not length.value:
+            return
+        binary = ctypes.create_string_buffer(length.value)
+        size, format = ctypes.c_int(0), ctypes.c_uint(0)
+        glGetProgramBinary(self.handle, length.value, ctypes.byref(size),
+                           ctypes.byref(format), binary)
+        try:
+            dirname = os.path.dirname(path)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            # write to a temporary file first such that concurrent processes
+            # never read a partial binary
+            temp = '%s.%d' % (path, os.getpid())
+            fid = open(temp, 'wb')
+            fid.write(struct.pack('<I', format.value))
+            fid.write(binary.raw[:size.value])
+            fid.close()
+            os.rename(temp, path)
+        except (IOError, OSError):
+            pass
+
     def bind(self):
         ''' Bind the program, i.e. use it. '''
-        gl.glUseProgram(self.handle)
+        state.use_program(self.handle)
+        if state.core():
+            self.uniform_matrixf('projection', state.projection.T.ravel())
+            self.uniform_matrixf('modelview', state.modelview.T.ravel())
+
+    def bind_image(self, texture, lut=None):
+        ''' Bind the program, image texture (unit 0), colormap (unit 1) and
+            normalization (unit 3) textures and upload parameters of image
+            shaders (see Nearest, Bilinear and Bicubic). '''
+        Shader.bind(self)
+        if lut is not None:
+            state.bind_texture(lut.target, lut.id, unit=1)
+            self.uniformi('lut', 1)
+            self.uniformf('lut_size', float(lut.width))
+        state.bind_texture(texture.target, texture.id, unit=0)
+        self.uniformi('texture', 0)
+        # Geometry left untouched (quad.draw sets these when blitting)
+        self.uniformf('quad', 0, 0, 0, 0)
+        self.uniformf('quad_texcoord', 0, 0, 0, 0)
+        self.uniformf('quad_depth', 0)
+        self.uniformf('elevation', self._elevation)
+        self.uniformf('bias', self._bias)
+        self.uniformf('scale', self._scale)
+        vmin, vmax = texture.range
+        self.uniformf('texel_range', vmin, vmax-vmin)
+        if self._norm is not None:
+            self.uniformf('norm_param', self._norm.param)
+            cdf = self._norm.texture()
+            if cdf is not None:
+                state.bind_texture(cdf.target, cdf.id, unit=3)
+                self.uniformi('cdf', 3)
+                self.uniformf('cdf_size', float(cdf.width))
+        self.uniformf('pixel', 1.0/texture.width, 1.0/texture.height)
+        self.uniformf('gridsize', *self._gridsize)
+        self.uniformf('gridwidth', *self._gridwidth)
+        self.uniformi('lighted', self._lighted)
 
     def unbind(self):
         ''' Unbind whatever program is currently bound - not necessarily this
             program, so this should probably be a class method instead. '''
-        gl.glUseProgram(0)
+        state.use_program(0)
+
+    def _location(self, name, vals):
+        ''' Location of named uniform if vals differ from last uploaded values,
+            None otherwise. '''
+
+        if self._values.get(name) == vals:
+            return None
+        loc = self.uniforms.get(name)
+        if loc is None:
+            # not reported as active, do not query it again
+            loc = gl.glGetUniformLocation(self.handle, name)
+            self.uniforms[name] = loc
+        self._values[name] = vals
+        if loc < 0:
+            return None
+        return loc
+
+    def uniform(self, name, *vals):
+        ''' Upload uniform value(s) using the function matching its declared
+            type, program must be currently bound. '''
+
+        type = self.uniform_types.get(name)
+        if type == gl.GL_FLOAT_MAT4:
+            self.uniform_matrixf(name, *vals)
+        elif type in _int_types:
+            self.uniformi(name, *vals)
+        else:
+            self.uniformf(name, *vals)
 
     def uniformf(self, name, *vals):
-        ''' Uploads float uniform(s), program must be currently bound. '''
+        ''' Uploads float uniform(s), program must be currently bound. Values
+            identical to the last uploaded ones are not uploaded again. '''
 
-        loc = self.uniforms.get(name,
-                                gl.glGetUniformLocation(self.handle,name))
-        self.uniforms[name] = loc
+        loc = self._location(name, vals)
+        if loc is None:
+            return
 
         # Check there are 1-4 values
         if len(vals) in range(1, 5):
@@ -137,11 +480,12 @@ class Shader:
             }[len(vals)](loc, *vals)
 
     def uniformi(self, name, *vals):
-        ''' Upload integer uniform(s), program must be currently bound. '''
+        ''' Upload integer uniform(s), program must be currently bound. Values
+            identical to the last uploaded ones are not uploaded again. '''
 
-        loc = self.uniforms.get(name,
-                                gl.glGetUniformLocation(self.handle,name))
-        self.uniforms[name] = loc
+        loc = self._location(name, vals)
+        if loc is None:
+            return
 
         # Checks there are 1-4 values
         if len(vals) in range(1, 5):
@@ -157,21 +501,110 @@ class Shader:
     def uniform_matrixf(self, name, mat):
         ''' Upload uniform matrix, program must be currently bound. '''
 
-        loc = self.uniforms.get(name,
-                                gl.glGetUniformLocation(self.handle,name))
-        self.uniforms[name] = loc
+        mat = tuple(mat)
+        loc = self._location(name, mat)
+        if loc is None:
+            return
 
         # Upload the 4x4 floating point matrix
         gl.glUniformMatrix4fv(loc, 1, False, (ctypes.c_float * 16)(*mat))
 
 
 
+def preprocess(filenames, defines=None):
+    ''' Build shader source from files.
+
+    #include "filename" directives are replaced with content of the file
+    (files being included only once) and given defines are inserted at the
+    top such that features can be selected with #ifdef directives.
+
+    Parameters
+    ----------
+    filenames: list of str
+        Files from the shader directory, in order
+
+    defines: dict
+        Preprocessor defines (name: value)
+    '''
+    lines = ['#define %s %s' % (name, value)
+             for name, value in sorted((defines or {}).items())]
+    included = set()
+    def include(filename):
+        if filename in included:
+            return
+        included.add(filename)
+        for line in read_shader(filename).split('\n'):
+            match = _include.match(line)
+            if match:
+                include(match.group(1))
+            else:
+                lines.append(line)
+    for filename in filenames:
+        include(filename)
+    return '\n'.join(lines)
+
+
+def translate(source, stage):
+    ''' Translate GLSL 1.10 source to GLSL 3.30 core profile source.
+
+    Parameters
+    ----------
+    source: str
+        Preprocessed source (see preprocess)
+
+    stage: 'vertex' or 'fragment'
+        Shader stage
+    '''
+    for pattern, name in _core_names[stage] + _core_common_names:
+        source = re.sub(pattern, name, source)
+    return _core_headers[stage] + '\n' + source
+
+
+def schedule(cls, **features):
+    ''' Schedule compilation of a variant (see compile_pending). '''
+
+    item = cls, tuple(sorted(features.items()))
+    if item not in _pending:
+        _pending.append(item)
+        if len(_pending) == 1 and _on_schedule is not None:
+            _on_schedule()
+
+
+def on_schedule(func):
+    ''' Set function to be called when a variant is scheduled while none was
+        pending, e.g. to start compiling them between frames (see Window). '''
+
+    global _on_schedule
+    _on_schedule = func
+
+
+def _forget():
+    ''' Forget programs of previous context. '''
+    global _has_program_binary
+    _programs.clear()
+    _has_program_binary = None
+
+state.on_new_context(_forget)
+
+
+def compile_pending(count=1):
+    ''' Compile up to count scheduled variants (GL context must be current),
+        return number of variants still pending. '''
+
+    for i in range(min(count, len(_pending))):
+        cls, features = _pending.pop(0)
+        cls.precompile(**dict(features))
+    return len(_pending)
+
+
 def read_shader(filename):
-    ''' Read a file from within the shader directory and return content '''
-    
-    dirname = os.path.dirname(__file__)
-    path = os.path.join(dirname, filename)
-    fid = open(path)
-    buf = fid.read()
-    fid.close()
-    return buf
+    ''' Read a file from within the shader directory and return content
+        (files are read only once). '''
+
+    if filename not in _sources:
+        dirname = os.path.dirname(__file__)
+        path = os.path.join(dirname, filename)
+        fid = open(path)
+        _sources[filename] = fid.read()
+        fid.close()
+    return _sources[filename]
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' OpenGL state cache.
+
+    Drawables change GL state through this module which remembers current
+    program, textures bound to each texture unit, bound buffers and vertex
+    array such that calls that would not change anything are not issued
+    (with PyOpenGL, each call has a significant python overhead). Issued and
+    elided calls are counted for each frame.
+
+    Capabilities and blend function are not cached since user code commonly
+    changes them directly (glEnable(GL_BLEND), ...) between drawables: these
+    calls are always issued. Other state changed behind the cache (direct GL
+    calls, glPopAttrib, foreign code such as AntTweakBar) must be signaled
+    using reset(). Window resets the cache at the start of each frame.
+
+    This module also holds the profile of the context (see Window) and, for
+    the core profile that has no fixed pipeline, the current color and the
+    projection and modelview matrices that shaders get as uniforms.
+
+    Example:
+    --------
+      state.enable(gl.GL_BLEND)
+      state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+      state.bind_texture(gl.GL_TEXTURE_2D, texture.id, unit=1)
+      issued, elided = state.stats()
+'''
+import os
+import numpy
+import OpenGL.GL as gl
+
+# Enabling these capabilities only affects active texture unit
+_texturing = (gl.GL_TEXTURE_1D, gl.GL_TEXTURE_2D, gl.GL_TEXTURE_3D)
+
+_program  = None
+_unit     = None
+_textures = {}
+_buffers  = {}
+_array    = None
+
+# Generic attribute locations of core profile shaders
+POSITION, COLOR, NORMAL, TEXCOORD = 0, 1, 2, 3
+
+_profile = os.environ.get('GLUMPY_PROFILE', 'compatibility')
+
+# Core profile matrices (row major, applied to column vectors)
+projection = numpy.eye(4, dtype=numpy.float32)
+modelview = numpy.eye(4, dtype=numpy.float32)
+_matrices = []
+
+# Functions forgetting GL objects of previous context (see new_context)
+_forget = []
+
+# Counters of frame in progress and of last complete frame
+_issued, _elided = 0, 0
+_last = 0, 0
+
+
+def _count(issued):
+    global _issued, _elided
+    if issued:
+        _issued += 1
+    else:
+        _elided += 1
+    return issued
+
+
+def reset():
+    ''' Forget cached state such that next calls are all issued. '''
+    global _program, _unit, _array
+    _program = None
+    _unit = None
+    _array = None
+    _textures.clear()
+    _buffers.clear()
+
+
+def on_new_context(func):
+    ''' Register a function forgetting GL objects (programs, textures,
+        buffers) cached by a module, called when a new context is created. '''
+    _forget.append(func)
+
+
+def new_context():
+    ''' Forget cached state and GL objects of previous context. '''
+    reset()
+    for func in _forget:
+        func()
+
+
+def new_frame():
+    ''' Reset cache and counters at the start of a new frame.
+
+    Returns
+    -------
+    Number of (issued, elided) calls during last frame.
+    '''
+    global _issued, _elided, _last
+    reset()
+    _last = _issued, _elided
+    _issued, _elided = 0, 0
+    return _last
+
+
+def stats():
+    ''' Number of (issued, elided) calls during last complete frame. '''
+    return _last
+
+
+def use_program(handle):
+    ''' Use given program (0 for fixed pipeline). '''
+    global _program
+    if _count(handle != _program):
+        gl.glUseProgram(handle)
+        _program = handle
+
+
+def active_texture(unit):
+    ''' Select active texture unit (0, 1, ...). '''
+    global _unit
+    if _count(unit != _unit):
+        gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+        _unit = unit
+
+
+def bind_texture(target, id, unit=None):
+    ''' Bind texture to given unit (active unit if None).
+
+    Active unit is only changed if the texture is not already bound to the
+    requested unit.
+    '''
+    if unit is None:
+        unit = _unit or 0
+    if not _count(_textures.get((unit, target)) != id):
+        return
+    active_texture(unit)
+    gl.glBindTexture(target, id)
+    _textures[(unit, target)] = id
+
+
+def forget_texture(id):
+    ''' Forget bindings of a deleted texture (its name may be reused). '''
+    for key, value in _textures.items():
+        if value == id:
+            del _textures[key]
+
+
+def enable(cap):
+    ''' Enable capability (texturing applies to active unit), always
+        issued. '''
+    if cap in _texturing and _unit is None:
+        active_texture(0)
+    _count(True)
+    gl.glEnable(cap)
+
+
+def disable(cap):
+    ''' Disable capability (texturing applies to active unit), always
+        issued. '''
+    if cap in _texturing and _unit is None:
+        active_texture(0)
+    _count(True)
+    gl.glDisable(cap)
+
+
+def blend_func(src, dst):
+    ''' Set blending function, always issued. '''
+    _count(True)
+    gl.glBlendFunc(src, dst)
+
+
+def bind_buffer(target, id):
+    ''' Bind buffer object to target (0 to unbind). '''
+    if _count(_buffers.get(target) != id):
+        gl.glBindBuffer(target, id)
+        _buffers[target] = id
+
+
+def forget_buffer(id):
+    ''' Forget bindings of a deleted buffer (its name may be reused). '''
+    for key, value in _buffers.items():
+        if value == id:
+            del _buffers[key]
+
+
+def bind_vertex_array(id):
+    ''' Bind vertex array object (0 to unbind). '''
+    global _array
+    if _count(_array != id):
+        gl.glBindVertexArray(id)
+        _array = id
+
+
+def set_profile(profile):
+    ''' Set profile of the context ('compatibility' or 'core'). '''
+    global _profile
+    if profile not in ['compatibility', 'core']:
+        raise ValueError('Unknown profile %s' % str(profile))
+    _profile = profile
+
+
+def profile():
+    ''' Profile of the context. '''
+    return _profile
+
+
+def core():
+    ''' Whether context uses the core profile (no fixed pipeline). '''
+    return _profile == 'core'
+
+
+def color(r, g, b, a=1.0):
+    ''' Set current color (generic color attribute in core profile). '''
+    if _profile == 'core':
+        gl.glVertexAttrib4f(COLOR, r, g, b, a)
+    else:
+        gl.glColor4f(r, g, b, a)
+
+
+def push_matrices():
+    ''' Save core profile projection and modelview matrices. '''
+    _matrices.append((projection.copy(), modelview.copy()))
+
+
+def pop_matrices():
+    ''' Restore last saved core profile matrices. '''
+    global projection, modelview
+    projection, modelview = _matrices.pop()
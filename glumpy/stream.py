@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Frame stream.
+
+    A stream gives access to the frames of a (possibly huge) array stored on
+    disk such as a .npy file opened as a memory map. Only requested frames are
+    read, a bounded number of them being kept in a cache while next frames
+    (in the scrubbing direction) are read ahead in a background thread.
+
+    Example:
+    --------
+      S = Stream('recording.npy', cache=16, readahead=4)
+      I = Image(S)
+      I.frame = 100
+'''
+import numpy
+import Queue
+import threading
+import collections
+
+
+class Stream(object):
+    ''' Frame stream over a memory mapped (or any buffer) array. '''
+
+    def __init__(self, data, cache=8, readahead=2):
+        '''
+        Parameters
+        ----------
+        data: filename, numpy array or object supporting the buffer protocol
+            Frames are indexed along first axis. A filename is opened as a
+            read-only memory map such that nothing is read at creation.
+
+        cache: int
+            Maximum number of frames kept in memory
+
+        readahead: int
+            Number of frames read in advance in the scrubbing direction
+        '''
+        if isinstance(data, basestring):
+            data = numpy.load(data, mmap_mode='r')
+        self._data = numpy.asarray(data)
+        if self._data.ndim < 2:
+            raise ValueError('Stream data must be at least 2D')
+        if self._data.dtype in [numpy.float32, numpy.uint8]:
+            self._dtype = self._data.dtype
+        else:
+            self._dtype = numpy.dtype(numpy.float32)
+        self._capacity = max(1, cache, readahead+1)
+        self._readahead = readahead
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._last = 0
+
+    def __len__(self):
+        return self._data.shape[0]
+
+    @property
+    def shape(self):
+        ''' Shape of a frame. '''
+        return self._data.shape[1:]
+
+    @property
+    def dtype(self):
+        ''' Data type of a frame (float32 or uint8). '''
+        return self._dtype
+
+    @property
+    def cached(self):
+        ''' Indices of frames currently in memory. '''
+        with self._lock:
+            return self._cache.keys()
+
+    def __getitem__(self, index):
+        ''' Read frame at given index (from cache if possible). '''
+
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Frame index out of range')
+        with self._lock:
+            Z = self._cache.pop(index, None)
+            if Z is not None:
+                self._cache[index] = Z
+        if Z is None:
+            Z = self._load(index)
+            self._insert(index, Z)
+
+        direction = 1 if index >= self._last else -1
+        self._last = index
+        if self._readahead:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            for i in range(1, self._readahead+1):
+                if 0 <= index + i*direction < len(self):
+                    self._queue.put(index + i*direction)
+        return Z
+
+    def _load(self, index):
+        ''' Read frame from underlying data. '''
+        return numpy.array(self._data[index], dtype=self._dtype)
+
+    def _insert(self, index, Z):
+        ''' Insert frame into cache, evicting least recently used frames. '''
+        with self._lock:
+            self._cache.pop(index, None)
+            self._cache[index] = Z
+            while len(self._cache) > self._capacity:
+                self._cache.popitem(last=False)
+
+    def _run(self):
+        ''' Read-ahead thread. '''
+        while True:
+            index = self._queue.get()
+            # Requests made obsolete by further scrubbing are dropped
+            if abs(index - self._last) > self._readahead:
+                continue
+            with self._lock:
+                if index in self._cache:
+                    continue
+            self._insert(index, self._load(index))
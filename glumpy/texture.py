@@ -11,8 +11,197 @@
     A texture is an image loaded into video memory that can be efficiently
     drawn to the framebuffer.
 '''
+import ctypes
 import numpy
+import collections
 import OpenGL.GL as gl
+import state
+import quad
+from shader import get_blit
+from OpenGL.GL.ARB.texture_float import *
+
+
+# Internal formats indexed by source format for byte, half, float and fixed
+# (16 bits, used when float textures are not available) precisions
+_internal_formats = {
+    gl.GL_ALPHA : {
+        'byte'  : gl.GL_ALPHA8,
+        'half'  : GL_ALPHA16F_ARB,
+        'float' : GL_ALPHA32F_ARB,
+        'fixed' : gl.GL_ALPHA16 },
+    gl.GL_LUMINANCE_ALPHA : {
+        'byte'  : gl.GL_LUMINANCE8_ALPHA8,
+        'half'  : GL_LUMINANCE_ALPHA16F_ARB,
+        'float' : GL_LUMINANCE_ALPHA32F_ARB,
+        'fixed' : gl.GL_LUMINANCE16_ALPHA16 },
+    gl.GL_RGB : {
+        'byte'  : gl.GL_RGB8,
+        'half'  : GL_RGB16F_ARB,
+        'float' : GL_RGB32F_ARB,
+        'fixed' : gl.GL_RGB16 },
+    gl.GL_RGBA : {
+        'byte'  : gl.GL_RGBA8,
+        'half'  : GL_RGBA16F_ARB,
+        'float' : GL_RGBA32F_ARB,
+        'fixed' : gl.GL_RGBA16 } }
+
+# Core profile has neither alpha nor luminance formats, single and two
+# channels data is stored in red (and green) channels and swizzled such that
+# shaders read it where they would in compatibility profile
+_core_formats = {
+    gl.GL_ALPHA : gl.GL_RED,
+    gl.GL_LUMINANCE_ALPHA : gl.GL_RG }
+_core_internal_formats = {
+    gl.GL_ALPHA : {
+        'byte'  : gl.GL_R8,
+        'half'  : gl.GL_R16F,
+        'float' : gl.GL_R32F,
+        'fixed' : gl.GL_R16 },
+    gl.GL_LUMINANCE_ALPHA : {
+        'byte'  : gl.GL_RG8,
+        'half'  : gl.GL_RG16F,
+        'float' : gl.GL_RG32F,
+        'fixed' : gl.GL_RG16 } }
+_core_swizzles = {
+    gl.GL_ALPHA : [gl.GL_ZERO, gl.GL_ZERO, gl.GL_ZERO, gl.GL_RED],
+    gl.GL_LUMINANCE_ALPHA : [gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_GREEN] }
+
+# GL filters indexed by interpolation
+_filters = { 'nearest' : gl.GL_NEAREST,
+             'linear'  : gl.GL_LINEAR }
+
+_float_textures = None
+_gl_version = None
+
+def has_float_textures():
+    ''' Whether float textures are supported by current GL context. '''
+
+    global _float_textures
+    if _float_textures is None:
+        # Float textures are part of core profile (OpenGL 3.0)
+        _float_textures = state.core() or bool(glInitTextureFloatARB())
+    return _float_textures
+
+
+def _forget():
+    ''' Forget capabilities of previous context. '''
+    global _float_textures, _gl_version
+    _float_textures = None
+    _gl_version = None
+
+state.on_new_context(_forget)
+
+
+def has_linear_filtering(precision):
+    ''' Whether textures stored with given precision can be linearly filtered
+        by current GL context.
+
+    Linear filtering of 32 bits float textures is only guaranteed since
+    OpenGL 3.0 while earlier float capable hardware only filters half floats.
+    '''
+
+    global _gl_version
+    if precision in ['byte', 'fixed']:
+        return True
+    if not has_float_textures():
+        return False
+    if precision == 'half':
+        return True
+    if _gl_version is None:
+        version = gl.glGetString(gl.GL_VERSION) or '0.0'
+        try:
+            _gl_version = int(version.split('.')[0])
+        except ValueError:
+            _gl_version = 0
+    return _gl_version >= 3
+
+
+def _texture_format(Z, format=None):
+    ''' Find texture target, source format and source type for Z. '''
+
+    # Check data type
+    dtype = Z.dtype
+    if dtype not in [numpy.float32, numpy.uint8]:
+        raise TextureException('Array data type must be float32 or uint8.')
+    if dtype == numpy.float32:
+        src_type = gl.GL_FLOAT
+    elif dtype == numpy.uint8:
+        src_type = gl.GL_UNSIGNED_BYTE
+
+    # Find shape & format
+    shape = Z.shape
+    if len(shape) == 1:
+        target = gl.GL_TEXTURE_1D
+        src_format = gl.GL_ALPHA
+    elif len(shape) == 2:
+        if shape[1] == 1 and format in [None, 'A']:
+            target = gl.GL_TEXTURE_1D
+            src_format = gl.GL_ALPHA
+        elif shape[1] == 2 and format in [None, 'LA']:
+            target = gl.GL_TEXTURE_1D
+            src_format = gl.GL_LUMINANCE_ALPHA
+        elif shape[1] == 3 and format in [None, 'RGB']:
+            target = gl.GL_TEXTURE_1D
+            src_format = gl.GL_RGB
+        elif shape[1] == 4 and format in [None, 'RGBA']:
+            target = gl.GL_TEXTURE_1D
+            src_format = gl.GL_RGBA
+        elif format in [None, 'RGBA']:
+            target = gl.GL_TEXTURE_2D
+            src_format = gl.GL_ALPHA
+        else:
+            raise TextureException(
+                'Array shape %s not compatible with any texture format'
+                % str(shape))
+    elif len(shape) == 3:
+        target = gl.GL_TEXTURE_2D
+        if shape[2] == 1 and format in [None, 'A']:
+            src_format = gl.GL_ALPHA
+        elif shape[2] == 2 and format in [None, 'LA']:
+            src_format = gl.GL_LUMINANCE_ALPHA
+        elif shape[2] == 3 and format in [None, 'RGB']:
+            src_format = gl.GL_RGB
+        elif shape[2] == 4 and format in [None, 'RGBA']:
+            src_format = gl.GL_RGBA
+        else:
+            raise TextureException(
+                'Array shape %s not compatible with any texture format'
+                % str(shape))
+    return target, src_format, src_type
+
+
+def _internal_format(src_format, precision):
+    ''' Internal format to store src_format data with given precision. '''
+
+    if state.core() and src_format in _core_internal_formats:
+        return _core_internal_formats[src_format][precision]
+    return _internal_formats[src_format][precision]
+
+
+def _texture_precision(src_type, precision=None):
+    ''' Find precision to use given source type and precision hint. '''
+
+    # Internal format depends on source type and precision hint. Float data
+    # is stored as is (normalization happens in the shader) and thus
+    # requires a float format not to be clamped to [0,1]. Without float
+    # formats, scalar float data is rescaled to [0,1] (see Texture.range).
+    if src_type == gl.GL_UNSIGNED_BYTE:
+        return 'byte'
+    elif not has_float_textures():
+        return 'fixed'
+    elif precision not in ['half', 'fixed']:
+        return 'float'
+    return precision
+
+
+def _fixed_range(Z, vmin=0.0, vmax=1.0):
+    ''' Range of finite values of Z, widened to include [vmin,vmax]. '''
+
+    with numpy.errstate(invalid='ignore'):
+        F = Z[numpy.isfinite(Z)]
+    if F.size:
+        vmin, vmax = min(vmin, float(F.min())), max(vmax, float(F.max()))
+    return vmin, vmax
 
 
 class TextureException(Exception):
@@ -27,7 +216,8 @@ class Texture(object):
     drawn to the framebuffer.
     '''
 
-    def __init__(self, Z, format=None, interpolation=None):
+    def __init__(self, Z, format=None, interpolation=None, streaming=False,
+                 precision=None):
         ''' Create texture.
 
         :Parameters:
@@ -42,14 +232,44 @@ class Texture(object):
                 possible to decide. For example an array with shape (M,3) can be
                 considered as 2D alpha texture of size (M,3) or a 1D RGB texture
                 of size (M,).
+            `interpolation`: [None | 'nearest' | 'linear']
+                Filter used by GL when the texture is sampled (nearest by
+                default). See filterable.
+            `streaming`: bool or int
+                If true, uploads go through a ring of pixel buffer objects (3
+                by default or the given number) such that a new frame can be
+                copied while the GPU is still transferring the previous one.
+            `precision`: [None | 'half' | 'float' | 'fixed']
+                Precision hint for float data that may be stored using half
+                (16 bits) or full (32 bits, default) float precision on the
+                GPU. 'fixed' (16 bits normalized, clamped to [0,1]) is used
+                when float textures are not supported, scalar (A or LA) data
+                being then rescaled on the CPU before upload (see range).
+                uint8 data is always stored using 8 bits.
         '''
         self._id = 0
+        self._pbos = []
+        self._pbo_index = 0
+        if streaming is True:
+            streaming = 3
+        self._streaming = int(streaming)
+        self._precision = precision
+        self._wrap = gl.GL_CLAMP_TO_EDGE
+        self._interpolation = interpolation or 'nearest'
+        self._staging = None
+        self._rescale = False
+        self._range = 0.0, 1.0
         self._build(Z, format)
 
 
     def __del__(self):
         if self._id and gl.glDeleteTextures:
+            state.forget_texture(self._id)
             gl.glDeleteTextures([self._id,])
+        if self._pbos and gl.glDeleteBuffers:
+            for pbo in self._pbos:
+                state.forget_buffer(pbo)
+            gl.glDeleteBuffers(len(self._pbos), self._pbos)
 
 
     @property
@@ -81,6 +301,116 @@ class Texture(object):
 
 
 
+    @property
+    def internal_format(self):
+        ''' GL internal format used to store data on the GPU.
+
+        :type: int, read-only
+        '''
+        return self.dst_format
+
+
+
+    @property
+    def precision(self):
+        ''' Precision used to store data on the GPU, one of 'byte', 'half',
+        'float' or 'fixed' (16 bits normalized).
+
+        :type: str, read-only
+        '''
+        return self._precision
+
+
+
+    @property
+    def range(self):
+        ''' Range of data mapped to [0,1] when stored (shaders reading
+        range[0] + value*(range[1]-range[0])).
+
+        This is (0,255) for scalar (A or LA) uint8 data, normalized by GL,
+        such that shaders get actual values back. This is (0,1) for other
+        data unless scalar float data is stored using 'fixed' precision
+        (float textures not supported): data is then rescaled to [0,1] on
+        the CPU before upload instead of being clamped, range being
+        computed on first upload and only widened by partial updates (out of
+        range values require the whole texture to be uploaded again). Values
+        are stored using 16 bits, i.e. steps of (range[1]-range[0])/65535,
+        such that precision is lost for data covering a large range.
+
+        :type: (float, float), read-only
+        '''
+        return self._range
+
+
+
+    @property
+    def streaming(self):
+        ''' Number of pixel buffer objects used for streaming uploads (0 if
+        uploads are synchronous).
+
+        :type: int, read-only
+        '''
+        return self._streaming
+
+
+
+    @property
+    def filterable(self):
+        ''' Whether GL can linearly filter the texture internal format.
+
+        :type: bool, read-only
+        '''
+        return has_linear_filtering(self._precision)
+
+
+
+    def _get_interpolation(self):
+        return self._interpolation
+    def _set_interpolation(self, interpolation):
+        if interpolation not in _filters:
+            raise TextureException(
+                'Unknown interpolation %s' % str(interpolation))
+        if interpolation == self._interpolation:
+            return
+        self._interpolation = interpolation
+        state.bind_texture(self.target, self.id)
+        gl.glTexParameterf(self.target, gl.GL_TEXTURE_MIN_FILTER,
+                           _filters[interpolation])
+        gl.glTexParameterf(self.target, gl.GL_TEXTURE_MAG_FILTER,
+                           _filters[interpolation])
+    interpolation = property(_get_interpolation, _set_interpolation,
+                    doc=''' Filter ('nearest' or 'linear') used by GL when
+                    the texture is sampled. ''')
+
+
+
+    def _get_wrap(self):
+        return self._wrap == gl.GL_REPEAT
+    def _set_wrap(self, wrap):
+        self._wrap = gl.GL_REPEAT if wrap else gl.GL_CLAMP_TO_EDGE
+        if self.target == gl.GL_TEXTURE_2D:
+            state.bind_texture(self.target, self.id)
+            gl.glTexParameterf(self.target, gl.GL_TEXTURE_WRAP_T, self._wrap)
+    wrap = property(_get_wrap, _set_wrap,
+                    doc=''' Whether texture coordinates wrap around along
+                    first array axis (rows), e.g. for circular buffers. ''')
+
+
+
+    def _get_data(self):
+        return self._Z
+    def _set_data(self, Z):
+        if Z.shape != self._Z.shape or Z.dtype != self._Z.dtype:
+            raise TextureException(
+                'Array shape and type must match texture shape and type.')
+        self._Z = Z
+    data = property(_get_data, _set_data,
+                    doc=''' Array holding texture data. Setting a new array
+                    (with same shape and type) does not upload it, see
+                    update. ''')
+
+
+
     @property
     def id(self):
         ''' GL texture name.
@@ -92,96 +422,45 @@ class Texture(object):
 
 
 
-    def blit(self, x, y, w, h, z=0, s=(0,1), t=(0,1)):
-        ''' Draw texture to active framebuffer. '''
+    def blit(self, x, y, w, h, z=0, s=(0,1), t=(0,1), shader=None):
+        ''' Draw texture to active framebuffer.
+
+        s gives texture coordinates of left and right edges while t gives
+        texture coordinates of top and bottom edges (first array row is drawn
+        at the top).
+
+        shader is the (already bound) shader used to draw the texture, which
+        must then be bound by the shader too. If None, texture is drawn as is,
+        modulated by current color.
+        '''
+
+        if shader is not None:
+            quad.draw(shader, x, y, w, h, z, s, t)
+            return
+        shader = get_blit(self.target)
+        shader.bind(self)
+        quad.draw(shader, x, y, w, h, z, s, t)
+        shader.unbind()
+
 
-        if self.target == gl.GL_TEXTURE_1D:
-            gl.glDisable (gl.GL_TEXTURE_2D)
-            gl.glEnable (gl.GL_TEXTURE_1D)
-            gl.glBindTexture(self.target, self.id)
-            gl.glBegin(gl.GL_QUADS)
-            gl.glTexCoord1f(s[0]), gl.glVertex2f(x,   y)
-            gl.glTexCoord1f(s[0]), gl.glVertex2f(x,   y+h)
-            gl.glTexCoord1f(s[1]), gl.glVertex2f(x+w, y+h)
-            gl.glTexCoord1f(s[1]), gl.glVertex2f(x+w, y)
-            gl.glEnd()
-        else:
-            gl.glEnable (gl.GL_TEXTURE_2D)
-            gl.glDisable (gl.GL_TEXTURE_1D)
-            gl.glBindTexture(self.target, self.id)
-            gl.glBegin(gl.GL_QUADS)
-            gl.glTexCoord2f(s[0], 1), gl.glVertex2f(x,   y)
-            gl.glTexCoord2f(s[0], 0), gl.glVertex2f(x,   y+h)
-            gl.glTexCoord2f(s[1], 0), gl.glVertex2f(x+w, y+h)
-            gl.glTexCoord2f(s[1], 1), gl.glVertex2f(x+w, y)
-            gl.glEnd()
-        gl.glDisable (gl.GL_TEXTURE_1D)
-        gl.glDisable (gl.GL_TEXTURE_2D)
-            
 
     def _build (self, Z, format=None):
         ''' Build a new texture from Z and format. '''
 
         self._Z = Z
 
-        # Check data type
-        dtype = Z.dtype
-        if dtype not in [numpy.float32, numpy.uint8]:
-            raise TextureException('Array data type must be float32 or uint8.')
-        if dtype == numpy.float32:
-            self.src_type = gl.GL_FLOAT
-        elif dtype == numpy.uint8:
-            self.src_type = gl.GL_UNSIGNED_BYTE
-
-        # Find shape & format
+        self._target, self.src_format, self.src_type = _texture_format(Z, format)
+        self._precision = _texture_precision(self.src_type, self._precision)
+        self.dst_format = _internal_format(self.src_format, self._precision)
+        self._rescale = (self._precision == 'fixed' and
+                         self.src_type == gl.GL_FLOAT and
+                         self.src_format in [gl.GL_ALPHA,
+                                             gl.GL_LUMINANCE_ALPHA])
+        self._range = 0.0, 1.0
+        if (self.src_type == gl.GL_UNSIGNED_BYTE and
+            self.src_format in [gl.GL_ALPHA, gl.GL_LUMINANCE_ALPHA]):
+            self._range = 0.0, 255.0
         shape = Z.shape
-        if len(shape) == 1:
-            self._target = gl.GL_TEXTURE_1D
-            self.src_format = gl.GL_ALPHA
-            self.dst_format = gl.GL_ALPHA16
-        elif len(shape) == 2:
-            if shape[1] == 1 and format in [None, 'A']:
-                self._target = gl.GL_TEXTURE_1D
-                self.src_format = gl.GL_ALPHA
-                self.dst_format = gl.GL_ALPHA16
-            elif shape[1] == 2 and format in [None, 'LA']:
-                self._target = gl.GL_TEXTURE_1D
-                self.src_format = gl.GL_LUMINANCE_ALPHA
-                self.dst_format = gl.GL_LUMINANCE16_ALPHA16
-            elif shape[1] == 3 and format in [None, 'RGB']:
-                self._target = gl.GL_TEXTURE_1D
-                self.src_format = gl.GL_RGB
-                self.dst_format = gl.GL_RGB16
-            elif shape[1] == 4 and format in [None, 'RGBA']:
-                self._target = gl.GL_TEXTURE_1D
-                self.src_format = gl.GL_RGBA
-                self.dst_format = gl.GL_RGBA16
-            elif format in [None, 'RGBA']:
-                self._target = gl.GL_TEXTURE_2D
-                self.src_format = gl.GL_ALPHA
-                self.dst_format = gl.GL_ALPHA16
-            else:
-                raise TextureException(
-                    'Array shape %s not compatible with any texture format'
-                    % str(shape))
-        elif len(shape) == 3:
-            self._target = gl.GL_TEXTURE_2D
-            if shape[2] == 1 and format in [None, 'A']:
-                self.src_format = gl.GL_ALPHA
-                self.dst_format = gl.GL_ALPHA16
-            elif shape[2] == 2 and format in [None, 'LA']:
-                self.src_format = gl.GL_LUMINANCE_ALPHA
-                self.dst_format = gl.GL_LUMINANCE16_ALPHA16
-            elif shape[2] == 3 and format in [None, 'RGB']:
-                self.src_format = gl.GL_RGB
-                self.dst_format = gl.GL_RGB16
-            elif shape[2] == 4 and format in [None, 'RGBA']:
-                self.src_format = gl.GL_RGBA
-                self.dst_format = gl.GL_RGBA16
-            else:
-                raise TextureException(
-                    'Array shape %s not compatible with any texture format'
-                    % str(shape))
 
         # Build texture
         if self.target == gl.GL_TEXTURE_2D:
@@ -193,51 +472,475 @@ class Texture(object):
 
         if self._id:
             #gl.glDeleteTextures(1, gl.byref(self._id))
+            state.forget_texture(self._id)
             gl.glDeleteTextures([self._id])
         #id = gl.GLuint()
         #gl.glGenTextures(1, gl.byref(id))
         self._id = gl.glGenTextures(1)
+        if self._streaming and not self._pbos:
+            self._pbos = list(numpy.atleast_1d(
+                gl.glGenBuffers(self._streaming)))
         gl.glPixelStorei (gl.GL_UNPACK_ALIGNMENT, 1)
         gl.glPixelStorei (gl.GL_PACK_ALIGNMENT, 1)
-        gl.glBindTexture (self.target, self.id)
+        state.bind_texture(self.target, self.id)
+        gl.glTexParameterf (self.target, gl.GL_TEXTURE_MIN_FILTER,
+                            _filters[self._interpolation])
+        gl.glTexParameterf (self.target, gl.GL_TEXTURE_MAG_FILTER,
+                            _filters[self._interpolation])
         gl.glTexParameterf (self.target,
-                            gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
-        gl.glTexParameterf (self.target,
-                            gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
-        gl.glTexParameterf (self.target, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP)
-        gl.glTexParameterf (self.target, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP)
+                            gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameterf (self.target, gl.GL_TEXTURE_WRAP_T, self._wrap)
+        self._format = self.src_format
+        if state.core() and self.src_format in _core_formats:
+            self._format = _core_formats[self.src_format]
+            gl.glTexParameteriv(self.target, gl.GL_TEXTURE_SWIZZLE_RGBA,
+                                _core_swizzles[self.src_format])
         if self._target == gl.GL_TEXTURE_1D:
             gl.glTexImage1D (self.target, 0, self.dst_format, width, 0,
-                             self.src_format, self.src_type, numpy.zeros(Z.shape,Z.dtype))
+                             self._format, self.src_type, None)
         else:
             gl.glTexImage2D (self.target, 0, self.dst_format, width, height, 0,
-                             self.src_format, self.src_type, numpy.zeros(Z.shape,Z.dtype))
+                             self._format, self.src_type, None)
         self.update()
 
 
-    def update(self, bias=0.0, scale=1.0):
-        ''' Update texture. '''
+    def update(self, region=None):
+        ''' Update texture.
+
+        Data is uploaded as is, any normalization (vmin/vmax) is left to the
+        shader such that changing the display range does not require a new
+        upload. Scalar float data stored using 'fixed' precision is rescaled
+        first (see range).
+
+        :Parameters:
+            `region` : None, (slice,slice) or list of (slice,slice)
+                Region(s) of the array that need to be uploaded. Overlapping
+                or adjacent regions are merged before upload. If None, the
+                whole array is uploaded.
+        '''
+
+        state.bind_texture(self.target, self.id)
+        if self.target == gl.GL_TEXTURE_1D:
+            whole = [(0, self._Z.shape[0], 0, 0)]
+        else:
+            whole = [(0, self._Z.shape[0], 0, self._Z.shape[1])]
+        if region is None:
+            regions = whole
+        else:
+            if type(region) is not list:
+                region = [region]
+            regions = merge_regions([self._region(r) for r in region])
+        if self._rescale and self._update_range(regions, region is None):
+            regions = whole
+
+        for y0, y1, x0, x1 in regions:
+            if self.target == gl.GL_TEXTURE_1D:
+                if y1 <= y0:
+                    continue
+                pixels = self._pixels(self._rescaled(self._Z[y0:y1]))
+                gl.glTexSubImage1D (self.target, 0, y0, y1-y0,
+                                    self._format, self.src_type, pixels)
+            else:
+                if y1 <= y0 or x1 <= x0:
+                    continue
+                pixels = self._pixels(self._rescaled(self._Z[y0:y1,x0:x1]))
+                gl.glTexSubImage2D (self.target, 0, x0, y0, x1-x0, y1-y0,
+                                    self._format, self.src_type, pixels)
+        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
+        if self._pbos:
+            state.bind_buffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+
+
+    def _update_range(self, regions, whole=False):
+        ''' Compute range from the whole array or widen it to include values
+        of given regions, return whether it has been widened. '''
+
+        if whole:
+            self._range = _fixed_range(self._Z)
+            return False
+        vmin, vmax = self._range
+        for y0, y1, x0, x1 in regions:
+            if self.target == gl.GL_TEXTURE_1D:
+                vmin, vmax = _fixed_range(self._Z[y0:y1], vmin, vmax)
+            else:
+                vmin, vmax = _fixed_range(self._Z[y0:y1,x0:x1], vmin, vmax)
+        widened = (vmin, vmax) != self._range
+        self._range = vmin, vmax
+        return widened
+
+
+    def _rescaled(self, Z):
+        ''' Z rescaled from range to [0,1] if needed (see range). '''
 
-        gl.glBindTexture(self.target, self.id)
+        if not self._rescale:
+            return Z
+        vmin, vmax = self._range
+        Z = numpy.subtract(Z, vmin, dtype=numpy.float32)
+        Z *= 1.0/(vmax-vmin)
+        return Z
 
-        # Autoscale array using OpenGL pixel transfer parameters
-        if self.target == gl.GL_TEXTURE_2D and self.src_type == gl.GL_FLOAT:
-            gl.glPixelTransferf(gl.GL_ALPHA_SCALE, scale)
-            gl.glPixelTransferf(gl.GL_ALPHA_BIAS, bias)
+
+    def _pixels(self, Z):
+        ''' Return what is to be given to glTexSubImage to upload Z.
+
+        Contiguous arrays and views whose rows are made of contiguous pixels
+        (e.g. Z[::2,100:900]) are read in place, using unpack row length for
+        the latter. Other views (e.g. fields of a structured array) are copied
+        into a staging buffer that is reused between updates.
+        '''
+
+        if self._pbos:
+            return self._stream(Z)
+        pixels, row_length = Z, 0
+        if not Z.flags.c_contiguous:
+            row_length = self._row_length(Z)
+            if row_length:
+                pixels = ctypes.c_void_p(Z.ctypes.data)
+            else:
+                if self._staging is None:
+                    self._staging = numpy.empty(self._Z.size, self._Z.dtype)
+                pixels = self._staging[:Z.size].reshape(Z.shape)
+                numpy.copyto(pixels, Z)
+        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, row_length)
+        return pixels
+
+
+    def _row_length(self, Z):
+        ''' Row length (in pixels) if rows of Z are made of contiguous pixels
+        and evenly spaced in memory, 0 otherwise. '''
+
+        if self.target != gl.GL_TEXTURE_2D or Z.ndim < 2:
+            return 0
+        pixel = Z.dtype.itemsize
+        if Z.ndim == 3:
+            if Z.strides[2] != pixel:
+                return 0
+            pixel *= Z.shape[2]
+        if (Z.strides[1] != pixel or Z.strides[0] % pixel or
+            Z.strides[0] < pixel*Z.shape[1]):
+            return 0
+        return Z.strides[0] // pixel
+
+
+    def _stream(self, Z):
+        ''' Copy Z into the next pixel buffer object of the ring (if
+        streaming) and return what is to be given to glTexSubImage. '''
+
+        pbo = self._pbos[self._pbo_index]
+        self._pbo_index = (self._pbo_index+1) % len(self._pbos)
+        state.bind_buffer(gl.GL_PIXEL_UNPACK_BUFFER, pbo)
+        # Orphan previous storage such that we never wait for the GPU to be
+        # done with it before writing new data
+        gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, Z.nbytes,
+                        None, gl.GL_STREAM_DRAW)
+        address = gl.glMapBuffer(gl.GL_PIXEL_UNPACK_BUFFER, gl.GL_WRITE_ONLY)
+        # Views are copied (and made contiguous) directly into the buffer
+        buffer = (ctypes.c_byte*Z.nbytes).from_address(address)
+        numpy.copyto(numpy.frombuffer(buffer, Z.dtype).reshape(Z.shape), Z)
+        gl.glUnmapBuffer(gl.GL_PIXEL_UNPACK_BUFFER)
+        # Data is read from the bound buffer, starting at offset 0
+        return None
+
+
+    def _region(self, region):
+        ''' Convert a region given as slices into (y0,y1,x0,x1). '''
+
+        if type(region) is not tuple:
+            region = (region,)
         if self.target == gl.GL_TEXTURE_1D:
-            gl.glTexSubImage1D (self.target, 0, 0, 
-                                self._Z.shape[0],
-                                self.src_format,
-                                self.src_type,
-                                self._Z) #.ctypes.data)
+            region = region[:1] + (slice(0,0),)
+        else:
+            region = region + (slice(None),)*(2-len(region))
+        bounds = []
+        for r, n in zip(region[:2], self._Z.shape[:2]):
+            if type(r) is not slice:
+                r = int(r) % n
+                r = slice(r, r+1)
+            start, stop, step = r.indices(n)
+            if step < 0:
+                start, stop = stop+1, start+1
+            bounds.extend([start, max(start,stop)])
+        if self.target == gl.GL_TEXTURE_1D:
+            bounds[2:] = [0, 0]
+        return tuple(bounds)
+
+
+
+def merge_regions(regions):
+    ''' Merge regions given as (y0,y1,x0,x1).
+
+    Two regions are merged whenever uploading their bounding box is not more
+    expensive than uploading them separately, which is the case for
+    overlapping, nested or aligned adjacent regions.
+    '''
+
+    def area(r):
+        return max(r[1]-r[0], 1) * max(r[3]-r[2], 1)
+
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i+1, len(regions)):
+                a, b = regions[i], regions[j]
+                u = (min(a[0],b[0]), max(a[1],b[1]),
+                     min(a[2],b[2]), max(a[3],b[3]))
+                if area(u) <= area(a) + area(b):
+                    regions[i] = u
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+
+class TiledTexture(Texture):
+    ''' Tiled texture object.
+
+    A tiled texture splits a 2D array that may be larger than the maximum
+    texture size into square tiles, each tile being a regular texture. Tiles
+    are only uploaded when they intersect the visible area and at most
+    `capacity` tiles are kept in video memory, least recently drawn tiles
+    being released first.
+    '''
+
+    def __init__(self, Z, format=None, tilesize=1024, border=2, capacity=64,
+                 precision=None):
+        ''' Create tiled texture.
+
+        :Parameters:
+            `Z` : numpy array
+                Z may be a float32 or uint8 array with following shapes:
+                    * MxN
+                    * MxNx[1,2,3,4]
+            `format`: [None | 'A' | 'LA' | 'RGB' | 'RGBA']
+                Specify the texture format to use.
+            `tilesize`: int
+                Size of the array area covered by a tile. Tile textures are
+                slightly larger since they include `border` pixels of
+                neighbouring tiles on each side.
+            `border`: int
+                Number of pixels shared with neighbouring tiles such that
+                interpolation is seamless across tiles (1 for bilinear, 2 for
+                bicubic interpolation).
+            `capacity`: int
+                Maximum number of tiles kept in video memory.
+            `precision`: [None | 'half' | 'float' | 'fixed']
+                Precision hint for float data (see Texture).
+        '''
+        self._id = 0
+        self._pbos = []
+        self._streaming = 0
+        if len(Z.shape) == 2:
+            Z = Z.reshape(Z.shape + (1,))
+        self._target, self.src_format, self.src_type = _texture_format(Z, format)
+        self._precision = _texture_precision(self.src_type, precision)
+        self.dst_format = _internal_format(self.src_format, self._precision)
+        self._Z = Z
+        self._height, self._width = Z.shape[:2]
+        self._border = border
+        size = int(gl.glGetIntegerv(gl.GL_MAX_TEXTURE_SIZE))
+        self._tilesize = max(1, min(tilesize, size - 2*border))
+        self._capacity = max(1, capacity)
+        self._interpolation = 'nearest'
+        self._tiles = collections.OrderedDict()
+
+
+    def __del__(self):
+        self._tiles.clear()
+
+
+    @property
+    def tilesize(self):
+        ''' Size of the array area covered by a tile.
+
+        :type: int, read-only
+        '''
+        return self._tilesize
+
+
+
+    @property
+    def capacity(self):
+        ''' Maximum number of tiles kept in video memory.
+
+        :type: int, read-only
+        '''
+        return self._capacity
+
+
+
+    @property
+    def resident(self):
+        ''' Indices (i,j) of tiles currently in video memory.
+
+        :type: list, read-only
+        '''
+        return self._tiles.keys()
+
+
+
+    def _set_interpolation(self, interpolation):
+        if interpolation not in _filters:
+            raise TextureException(
+                'Unknown interpolation %s' % str(interpolation))
+        self._interpolation = interpolation
+        for T in self._tiles.values():
+            T.interpolation = interpolation
+    interpolation = property(Texture._get_interpolation, _set_interpolation,
+                    doc=''' Filter ('nearest' or 'linear') used by GL when
+                    tiles are sampled. ''')
+
+
+
+    def tile(self, i, j):
+        ''' Get texture of tile (i,j), uploading it if not resident. '''
+
+        key = i, j
+        if key in self._tiles:
+            T = self._tiles.pop(key)
         else:
-            gl.glTexSubImage2D (self.target, 0, 0, 0,
-                                self._Z.shape[1],
-                                self._Z.shape[0],
-                                self.src_format,
-                                self.src_type,
-                                self._Z) #.ctypes.data)
-        if self.target == gl.GL_TEXTURE_2D and self.src_type == gl.GL_FLOAT:
-           # Default parameters
-           gl.glPixelTransferf(gl.GL_ALPHA_SCALE, 1)
-           gl.glPixelTransferf(gl.GL_ALPHA_BIAS, 0)
+            while len(self._tiles) >= self._capacity:
+                self._tiles.popitem(last=False)
+            y0, y1, x0, x1 = self._bounds(i, j, self._border)
+            T = Texture(self._Z[y0:y1,x0:x1], precision=self._precision,
+                        interpolation=self._interpolation)
+        self._tiles[key] = T
+        return T
+
+
+    def tiles(self, x, y, w, h):
+        ''' Iterate over visible tiles when array is drawn on (x,y,w,h).
+
+        Each item is (texture, (x,y,w,h), s, t) where (x,y,w,h) is the area
+        covered by the tile and s,t are texture coordinates of the tile
+        interior (see Texture.blit).
+        '''
+
+        n = self._tilesize
+        u0, u1, v0, v1 = _visible(x, y, w, h)
+        if u1 <= u0 or v1 <= v0:
+            return
+        # Visible rows are counted from the top
+        r0, r1 = int((1-v1)*self._height), int(numpy.ceil((1-v0)*self._height))
+        c0, c1 = int(u0*self._width), int(numpy.ceil(u1*self._width))
+        for i in range(r0//n, (min(r1, self._height)-1)//n + 1):
+            for j in range(c0//n, (min(c1, self._width)-1)//n + 1):
+                T = self.tile(i, j)
+                y0, y1, x0, x1 = self._bounds(i, j)
+                py0, py1, px0, px1 = self._bounds(i, j, self._border)
+                s = ((x0-px0)/float(px1-px0), (x1-px0)/float(px1-px0))
+                t = ((y0-py0)/float(py1-py0), (y1-py0)/float(py1-py0))
+                area = (x + w*x0/float(self._width),
+                        y + h*(1-y1/float(self._height)),
+                        w*(x1-x0)/float(self._width),
+                        h*(y1-y0)/float(self._height))
+                yield T, area, s, t
+
+
+    def blit(self, x, y, w, h):
+        ''' Draw visible tiles to active framebuffer. '''
+
+        for T, area, s, t in self.tiles(x, y, w, h):
+            T.blit(*area, s=s, t=t)
+
+
+    def update(self, region=None):
+        ''' Update texture.
+
+        Only resident tiles intersecting the region are uploaded, other tiles
+        will be uploaded when they become visible.
+
+        :Parameters:
+            `region` : None, (slice,slice) or list of (slice,slice)
+                Region(s) of the array that need to be uploaded. If None, the
+                whole array is uploaded.
+        '''
+
+        if region is None:
+            regions = [(0, self._height, 0, self._width)]
+        else:
+            if type(region) is not list:
+                region = [region]
+            regions = merge_regions([self._region(r) for r in region])
+        for (i, j), T in self._tiles.items():
+            py0, py1, px0, px1 = self._bounds(i, j, self._border)
+            local = []
+            for y0, y1, x0, x1 in regions:
+                y0, y1 = max(y0, py0), min(y1, py1)
+                x0, x1 = max(x0, px0), min(x1, px1)
+                if y0 < y1 and x0 < x1:
+                    local.append((slice(y0-py0, y1-py0), slice(x0-px0, x1-px0)))
+            if local:
+                T.update(local)
+
+
+    def _bounds(self, i, j, border=0):
+        ''' Array area (y0,y1,x0,x1) covered by tile (i,j) including given
+        border. '''
+
+        n = self._tilesize
+        return (max(i*n-border, 0), min((i+1)*n+border, self._height),
+                max(j*n-border, 0), min((j+1)*n+border, self._width))
+
+
+
+def _project(x, y, w, h):
+    ''' Project bottom-left, bottom-right and top-left corners of the
+        (x,y,w,h) area to normalized device coordinates using current
+        modelview and projection matrices (None if projection is not
+        affine). '''
+
+    if state.core():
+        # Row major matrices applied to column vectors
+        modelview = numpy.asarray(state.modelview, dtype=float).T
+        projection = numpy.asarray(state.projection, dtype=float).T
+    else:
+        # Column major matrices, i.e. transposed once reshaped
+        modelview = numpy.array(gl.glGetDoublev(gl.GL_MODELVIEW_MATRIX))
+        projection = numpy.array(gl.glGetDoublev(gl.GL_PROJECTION_MATRIX))
+        modelview, projection = modelview.reshape(4,4), projection.reshape(4,4)
+    C = numpy.array([[x,y,0,1], [x+w,y,0,1], [x,y+h,0,1]], dtype=float)
+    C = numpy.dot(numpy.dot(C, modelview), projection)
+    if not numpy.allclose(C[:,3], C[0,3]) or C[0,3] <= 0:
+        return None
+    return C[:,:2]/C[0,3]
+
+
+def _visible(x, y, w, h):
+    ''' Fractions (u0,u1,v0,v1) of the (x,y,w,h) area that are visible within
+        current viewport.
+
+    u goes from left to right and v from bottom to top. The whole area is
+    considered visible if projection is not affine.
+    '''
+
+    C = _project(x, y, w, h)
+    if C is None:
+        return 0.0, 1.0, 0.0, 1.0
+    # Express corners of the normalized device square in (u,v) coordinates
+    A = numpy.array([C[1]-C[0], C[2]-C[0]]).T
+    if abs(numpy.linalg.det(A)) < 1e-12:
+        return 0.0, 0.0, 0.0, 0.0
+    D = numpy.array([[-1,-1], [1,-1], [1,1], [-1,1]], dtype=float) - C[0]
+    U = numpy.linalg.solve(A, D.T)
+    u0, u1 = numpy.clip([U[0].min(), U[0].max()], 0, 1)
+    v0, v1 = numpy.clip([U[1].min(), U[1].max()], 0, 1)
+    return u0, u1, v0, v1
+
+
+def screen_size(x, y, w, h):
+    ''' Size (in window pixels) of the (x,y,w,h) area once projected using
+        current modelview, projection and viewport (None if projection is not
+        affine). '''
+
+    C = _project(x, y, w, h)
+    if C is None:
+        return None
+    viewport = gl.glGetIntegerv(gl.GL_VIEWPORT)
+    half = numpy.array([viewport[2], viewport[3]], dtype=float)/2.0
+    return (numpy.sqrt((((C[1]-C[0])*half)**2).sum()),
+            numpy.sqrt((((C[2]-C[0])*half)**2).sum()))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Transformation matrices.
+
+    Equivalents of glOrtho, glFrustum and glTranslate for the core profile
+    where matrices are given to shaders as uniforms (see state). Matrices are
+    row major and apply to column vectors.
+'''
+import numpy
+
+
+def ortho(left, right, bottom, top, near, far):
+    ''' Orthographic projection matrix (see glOrtho). '''
+
+    M = numpy.zeros((4,4), dtype=numpy.float32)
+    M[0,0] = 2.0/(right-left)
+    M[1,1] = 2.0/(top-bottom)
+    M[2,2] = -2.0/(far-near)
+    M[0,3] = -(right+left)/float(right-left)
+    M[1,3] = -(top+bottom)/float(top-bottom)
+    M[2,3] = -(far+near)/float(far-near)
+    M[3,3] = 1.0
+    return M
+
+
+def frustum(left, right, bottom, top, near, far):
+    ''' Perspective projection matrix (see glFrustum). '''
+
+    M = numpy.zeros((4,4), dtype=numpy.float32)
+    M[0,0] = 2.0*near/(right-left)
+    M[1,1] = 2.0*near/(top-bottom)
+    M[0,2] = (right+left)/float(right-left)
+    M[1,2] = (top+bottom)/float(top-bottom)
+    M[2,2] = -(far+near)/float(far-near)
+    M[2,3] = -2.0*far*near/(far-near)
+    M[3,2] = -1.0
+    return M
+
+
+def translate(x, y, z):
+    ''' Translation matrix (see glTranslate). '''
+
+    M = numpy.eye(4, dtype=numpy.float32)
+    M[:3,3] = x, y, z
+    return M
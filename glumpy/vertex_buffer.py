@@ -13,6 +13,7 @@ import OpenGL
 import OpenGL.GL as gl
 import OpenGL.GLU as glu
 import OpenGL.GLUT as glut
+import state
 
 
 class VertexAttribute(object):
@@ -120,6 +121,14 @@ class VertexAttribute_generic(VertexAttribute):
 
 
 
+# Generic attribute locations of core profile shaders (see state)
+_core_locations = { 'position' : state.POSITION,
+                    'color'    : state.COLOR,
+                    'normal'   : state.NORMAL,
+                    'tex_coord': state.TEXCOORD }
+
+
+
 class VertexBufferException(Exception):
     pass
 
@@ -138,6 +147,10 @@ class VertexBuffer(object):
         stride = vertices.itemsize
         offset = 0
         index = 1 # Generic attribute indices starts at 1
+        if state.core():
+            # Core profile only has generic attributes, other ones follow
+            # those of named attributes
+            index = len(_core_locations)
         self.attributes = {}
         self.generic_attributes = []
         if indices is None:
@@ -154,7 +167,11 @@ class VertexBuffer(object):
             if gtype not in gltypes.keys():
                 raise VertexBufferException
             gltype = gltypes[gtype]
-            if name in['position', 'color', 'normal', 'tex_coord',
+            if state.core() and name in _core_locations:
+                attribute = VertexAttribute_generic(count,gltype,stride,offset,
+                                                    _core_locations[name])
+                self.attributes[name[0]] = attribute
+            elif name in['position', 'color', 'normal', 'tex_coord',
                        'fog_coord', 'secondary_color', 'edge_flag']:
                 vclass = 'VertexAttribute_%s' % name
                 attribute = eval(vclass)(count,gltype,stride,offset)
@@ -166,36 +183,69 @@ class VertexBuffer(object):
             offset += dtype[name].itemsize
         self.vertices = vertices
         self.vertices_id = gl.glGenBuffers(1)
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
         gl.glBufferData( gl.GL_ARRAY_BUFFER, self.vertices, gl.GL_STATIC_DRAW )
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, 0 )
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, 0 )
 
         self.indices = indices
         self.indices_id = gl.glGenBuffers(1)
-        gl.glBindBuffer( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices_id )
+        state.bind_buffer( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices_id )
         gl.glBufferData( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices, gl.GL_STATIC_DRAW )
-        gl.glBindBuffer( gl.GL_ELEMENT_ARRAY_BUFFER, 0 )
+        state.bind_buffer( gl.GL_ELEMENT_ARRAY_BUFFER, 0 )
+
+        # Core profile draws through a vertex array object recording buffers
+        # and attributes setup
+        self.array_id = 0
+        self._what = None
+        if state.core():
+            self.array_id = gl.glGenVertexArrays(1)
+            state.bind_vertex_array( self.array_id )
+            state.bind_buffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
+            gl.glBindBuffer( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices_id )
+            for attribute in self.generic_attributes:
+                attribute.enable()
+            state.bind_vertex_array( 0 )
+            state.bind_buffer( gl.GL_ARRAY_BUFFER, 0 )
 
     def upload(self):
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
         gl.glBufferData( gl.GL_ARRAY_BUFFER, self.vertices, gl.GL_STATIC_DRAW )
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, 0 )
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, 0 )
         
 
 
     def draw( self, mode=gl.GL_QUADS, what='pnctesf' ):
+        if self.array_id:
+            return self._draw_core( mode, what )
+        # Buffers are bound outside of client attributes push/pop such that
+        # popped bindings match cached ones
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
+        state.bind_buffer( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices_id )
         gl.glPushClientAttrib( gl.GL_CLIENT_VERTEX_ARRAY_BIT )
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
-        gl.glBindBuffer( gl.GL_ELEMENT_ARRAY_BUFFER, self.indices_id )
         for attribute in self.generic_attributes:
             attribute.enable()
         for c in self.attributes.keys():
             if c in what:
                 self.attributes[c].enable()
         gl.glDrawElements( mode, self.indices.size, gl.GL_UNSIGNED_INT, None)
-        gl.glBindBuffer( gl.GL_ELEMENT_ARRAY_BUFFER, 0 )
-        gl.glBindBuffer( gl.GL_ARRAY_BUFFER, 0 )
         gl.glPopClientAttrib( )
+        state.bind_buffer( gl.GL_ELEMENT_ARRAY_BUFFER, 0 )
+        state.bind_buffer( gl.GL_ARRAY_BUFFER, 0 )
+
+    def _draw_core( self, mode, what ):
+        ''' Draw using vertex array object (core profile). '''
+        state.bind_vertex_array( self.array_id )
+        if what != self._what:
+            # Named attributes arrays are recorded in the vertex array object
+            state.bind_buffer( gl.GL_ARRAY_BUFFER, self.vertices_id )
+            for c, attribute in self.attributes.items():
+                if c in what:
+                    attribute.enable()
+                else:
+                    gl.glDisableVertexAttribArray( attribute.index )
+            self._what = what
+        gl.glDrawElements( mode, self.indices.size, gl.GL_UNSIGNED_INT, None)
+        state.bind_vertex_array( 0 )
 
 
 
@@ -10,7 +10,7 @@ import sys, time
 import atexit
 import OpenGL.GL as gl
 import OpenGL.GLUT as glut
-import key, mouse, event, proxy
+import key, mouse, event, proxy, shader, state, transforms
 import _ctypes
 import threading
 import traceback
@@ -60,8 +60,21 @@ class Window(event.EventDispatcher, Singleton):
     _default_height = 480
 
 
-    def __init__(self, width=None, height=None, caption=None, visible=True, fullscreen=False):
+    def __init__(self, width=None, height=None, caption=None, visible=True,
+                 fullscreen=False, profile=None):
+        ''' Create the window.
 
+        profile is either 'compatibility' (fixed pipeline is available) or
+        'core' (OpenGL 3.3 core profile, every drawable uses shaders, vertex
+        array objects and R/RG textures). None keeps current profile, given
+        by the GLUMPY_PROFILE environment variable when glumpy is imported
+        (default is 'compatibility'). Changing the profile creates a new GL
+        context: shared objects (programs, kernels, unit quad, colormap
+        textures) are built again when needed, but images and textures
+        created before must be created again.
+        '''
+
+        global _window
         event.EventDispatcher.__init__(self)
 
         self._event_queue = []
@@ -79,13 +92,33 @@ class Window(event.EventDispatcher, Singleton):
 
         self._saved_width  = self._width
         self._saved_height = self._height
+        self._precompiling = False
 
+        previous = state.profile()
+        if profile is not None:
+            state.set_profile(profile)
         if _window is None:
             glut.glutInit(sys.argv)
+        if _window is None or state.profile() != previous:
+            if _window is not None:
+                # Programs, textures and buffers of the previous context
+                # cannot be used by the new one
+                glut.glutDestroyWindow(self._window_id)
+                state.new_context()
+            if state.core():
+                glut.glutInitContextVersion(3, 3)
+                glut.glutInitContextProfile(glut.GLUT_CORE_PROFILE)
+                glut.glutInitContextFlags(glut.GLUT_FORWARD_COMPATIBLE)
+            elif _window is not None:
+                # Back to default context attributes
+                glut.glutInitContextVersion(1, 0)
+                glut.glutInitContextProfile(glut.GLUT_COMPATIBILITY_PROFILE)
+                glut.glutInitContextFlags(0)
             glut.glutInitDisplayMode(glut.GLUT_DOUBLE |
                                      glut.GLUT_RGBA   |
                                      glut.GLUT_DEPTH)
             self._window_id = glut.glutCreateWindow(self._caption)
+            _window = self
         glut.glutDisplayFunc(self._display)
         glut.glutReshapeFunc(self._reshape)
         glut.glutKeyboardFunc(self._keyboard)
@@ -192,6 +225,8 @@ class Window(event.EventDispatcher, Singleton):
 
 
     def _display(self):
+        # GL state may have been changed outside of the cache between frames
+        state.new_frame()
         #self.clear()
         self.dispatch_event('on_draw')
         self.flip()
@@ -311,6 +346,24 @@ class Window(event.EventDispatcher, Singleton):
         return True
 
 
+    def _precompile(self, value):
+        ''' Compile one scheduled shader variant between frames, timer being
+            stopped once none is pending '''
+
+        if shader.compile_pending(1):
+            glut.glutTimerFunc(100, self._precompile, 0)
+        else:
+            self._precompiling = False
+
+
+    def _start_precompile(self):
+        ''' Start compiling scheduled shader variants (if not started) '''
+
+        if not self._precompiling:
+            self._precompiling = True
+            glut.glutTimerFunc(100, self._precompile, 0)
+
+
     def mainloop(self, interactive=False, namespace=globals()):
         '''Starts main loop
         '''
@@ -333,6 +386,11 @@ class Window(event.EventDispatcher, Singleton):
             if 'on_idle' in item.keys():
                 glut.glutIdleFunc(self._idle)
 
+        # Shader variants likely to be needed are compiled in the background
+        shader.on_schedule(self._start_precompile)
+        if shader.compile_pending(0):
+            self._start_precompile()
+
         self.dispatch_event('on_init')
 
         # Starts non-interactive mode
@@ -487,6 +545,9 @@ class Window(event.EventDispatcher, Singleton):
         projection, for example in perspective.
         '''
         gl.glViewport(0, 0, width, height)
+        if state.core():
+            state.projection = transforms.ortho(0, width, 0, height, -1, 1)
+            return
         gl.glMatrixMode(gl.GL_PROJECTION)
         gl.glLoadIdentity()
         gl.glOrtho(0, width, 0, height, -1, 1)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Autoscale policies tests (no GL context needed). '''
+import os
+import sys
+import types
+import unittest
+import numpy
+
+# Importing glumpy opens a window, modules are loaded from the package
+# directory without running glumpy/__init__.py
+if 'glumpy' not in sys.modules:
+    package = types.ModuleType('glumpy')
+    package.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'glumpy')]
+    sys.modules['glumpy'] = package
+from glumpy import autoscale
+
+
+class TestAutoscale(unittest.TestCase):
+
+    def setUp(self):
+        self.Z = numpy.random.RandomState(0).uniform(0, 1, (64,32))
+
+    def test_exact(self):
+        policy = autoscale.Autoscale(threads=1)
+        self.assertEqual(policy(self.Z), (self.Z.min(), self.Z.max()))
+
+    def test_widen(self):
+        policy = autoscale.Autoscale(threads=1)
+        policy(self.Z)
+        # Rows out of region are not read again
+        self.Z[0] = -5.0
+        self.Z[1] = 2.0
+        policy.update((slice(1,2),), widen=True)
+        self.assertEqual(policy(self.Z), (self.Z[2:].min(), 2.0))
+
+    def test_widen_never_shrinks(self):
+        policy = autoscale.Sampled(samples=16, threads=1)
+        vmin, vmax = policy(self.Z)
+        self.Z[3] = 0.5
+        policy.update((slice(3,4),), widen=True)
+        self.assertEqual(policy(self.Z), (vmin, vmax))
+
+    def test_full_update(self):
+        policy = autoscale.Autoscale(threads=1)
+        policy(self.Z)
+        self.Z[0] = -5.0
+        policy.update((slice(1,2),), widen=True)
+        policy.update()
+        self.assertEqual(policy(self.Z)[0], -5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
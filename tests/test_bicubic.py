@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Accuracy of fast bicubic interpolation (shader/bicubic_fast.txt) against
+    reference bicubic interpolation (shader/bicubic.txt) using the B-spline
+    kernel.
+
+    No GL context being needed, the interpolated_texture2D functions are read
+    from the shader sources, translated to python and run on the CPU with
+    emulated texture fetches (nearest or linear filtering, kernel texture).
+    This checks the shader code itself but not its compilation nor the
+    hardware filtering precision (emulated with 8 bits fixed point weights).
+'''
+import os
+import re
+import sys
+import types
+import unittest
+import numpy
+
+# Importing glumpy opens a window, modules are loaded from the package
+# directory without running glumpy/__init__.py
+if 'glumpy' not in sys.modules:
+    package = types.ModuleType('glumpy')
+    package.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'glumpy')]
+    sys.modules['glumpy'] = package
+from glumpy.shader import bicubic, shader
+
+# Fractional positions within a texel
+FRACTIONS = numpy.linspace(0.0, 1.0, 17)[:-1]
+
+# Size of kernel texture (see bicubic.get_kernel)
+KERNEL_SIZE = 256
+
+
+class Vec(numpy.ndarray):
+    ''' GLSL vector (components accessed as x, y, z, w). '''
+    x = property(lambda self: self[0])
+    y = property(lambda self: self[1])
+    z = property(lambda self: self[2])
+    w = property(lambda self: self[3])
+
+def vec(*values):
+    return numpy.array(values, dtype=float).view(Vec)
+
+def fract(v):
+    return v - numpy.floor(v)
+
+
+def translate(source, name):
+    ''' Python source of the GLSL function name (scalars and vectors only). '''
+    match = re.search(r'\b%s\s*\(([^)]*)\)\s*\{(.*?)\n\}' % name, source, re.S)
+    args = [arg.split()[-1] for arg in match.group(1).split(',')]
+    body = re.sub(r'//[^\n]*', '', match.group(2))
+    lines = []
+    for statement in body.split(';'):
+        statement = ' '.join(statement.split())
+        statement = re.sub(r'^(float|vec[234])\s+', '', statement)
+        if statement:
+            lines.append('    ' + statement)
+    return 'def %s(%s):\n%s\n' % (name, ', '.join(args), '\n'.join(lines))
+
+
+def load(filename, fetch, functions):
+    ''' Shader functions of filename, texture2D being emulated by fetch. '''
+    source = shader.read_shader(filename)
+    namespace = {'vec2': vec, 'vec4': vec, 'fract': fract,
+                 'texture2D': fetch, 'texture1D': kernel_fetch}
+    for name in functions:
+        exec translate(source, name) in namespace
+    return namespace['interpolated_texture2D']
+
+
+def kernel_fetch(kernel, x):
+    ''' Nearest fetch of the B-spline kernel texture (see build_kernel). '''
+    x = min(int(x*KERNEL_SIZE), KERNEL_SIZE-1)/float(KERNEL_SIZE-1)
+    k = bicubic.mitchell_netravali
+    return vec(k(x+1), k(x), k(1-x), k(2-x))
+
+
+def nearest_fetch(Z, uv):
+    i = int(numpy.floor(uv.x*Z.shape[1]))
+    j = int(numpy.floor(uv.y*Z.shape[0]))
+    return Z[j,i]
+
+
+def linear_fetch(Z, uv, bits=None):
+    ''' Linearly filtered fetch, optionally using fixed point weights. '''
+    x, y = uv.x*Z.shape[1]-0.5, uv.y*Z.shape[0]-0.5
+    i, j = int(numpy.floor(x)), int(numpy.floor(y))
+    fx, fy = x-i, y-j
+    if bits:
+        fx = numpy.round(fx*2**bits)/2**bits
+        fy = numpy.round(fy*2**bits)/2**bits
+    return ((1-fy)*((1-fx)*Z[j,i] + fx*Z[j,i+1]) +
+            fy*((1-fx)*Z[j+1,i] + fx*Z[j+1,i+1]))
+
+
+def exact(Z, x, y):
+    ''' Exact B-spline interpolation at (x,y) given in texels. '''
+    k = bicubic.mitchell_netravali
+    i, j = int(numpy.floor(x)), int(numpy.floor(y))
+    fx, fy = x-i, y-j
+    wx = numpy.array([k(fx+1), k(fx), k(1-fx), k(2-fx)])
+    wy = numpy.array([k(fy+1), k(fy), k(1-fy), k(2-fy)])
+    return numpy.dot(wy, numpy.dot(Z[j-1:j+3, i-1:i+3], wx))
+
+
+class TestBicubicFast(unittest.TestCase):
+
+    def setUp(self):
+        self.Z = numpy.random.RandomState(1).uniform(0, 1, (8,8))
+        self.pixel = vec(1.0/self.Z.shape[1], 1.0/self.Z.shape[0])
+        self.positions = [(3+fx, 4+fy) for fy in FRACTIONS for fx in FRACTIONS]
+
+    def interpolate(self, function, x, y):
+        return function(self.Z, None, vec(x, y)*self.pixel, self.pixel)
+
+    def test_fast_exact(self):
+        fast = load('bicubic_fast.txt', linear_fetch, ['interpolated_texture2D'])
+        for x, y in self.positions:
+            self.assertAlmostEqual(self.interpolate(fast, x, y),
+                                   exact(self.Z, x, y), places=6)
+
+    def test_fast_reference(self):
+        fast = load('bicubic_fast.txt', linear_fetch, ['interpolated_texture2D'])
+        reference = load('bicubic.txt', nearest_fetch,
+                         ['cubic_filter', 'interpolated_texture2D'])
+        # Reference is limited by the kernel texture resolution
+        for x, y in self.positions:
+            self.assertAlmostEqual(self.interpolate(fast, x, y),
+                                   self.interpolate(reference, x, y), places=2)
+
+    def test_fast_fixed_point(self):
+        # Hardware filtering uses (at least) 8 bits fixed point weights, error
+        # must stay below one 8 bits level
+        fetch = lambda Z, uv: linear_fetch(Z, uv, bits=8)
+        fast = load('bicubic_fast.txt', fetch, ['interpolated_texture2D'])
+        error = max(abs(self.interpolate(fast, x, y) - exact(self.Z, x, y))
+                    for x, y in self.positions)
+        self.assertTrue(error < 1.0/255, error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Streaming histogram tests (no GL context needed). '''
+import os
+import sys
+import types
+import unittest
+import numpy
+
+# Importing glumpy opens a window, modules are loaded from the package
+# directory without running glumpy/__init__.py
+if 'glumpy' not in sys.modules:
+    package = types.ModuleType('glumpy')
+    package.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'glumpy')]
+    sys.modules['glumpy'] = package
+from glumpy import histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.Z = numpy.random.RandomState(0).uniform(0, 1, (64,32))
+        self.H = histogram.Histogram(low=0.0, high=100.0, bins=256, bands=8,
+                                     threads=1)
+
+    def test_full_then_region_update(self):
+        self.H(self.Z)
+        self.H.update()
+        self.H.update((slice(0,3),))
+        self.Z[0:3] = 0.5
+        self.H(self.Z)
+        self.assertEqual(self.H.counts.sum(), self.Z.size)
+
+    def test_region_update(self):
+        self.H(self.Z)
+        self.Z[10:12] = 0.5
+        self.H.update((slice(10,12),))
+        self.H(self.Z)
+        expected = numpy.histogram(self.Z, 256, range=self.H.bounds)[0]
+        self.assertTrue((self.H.counts == expected).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
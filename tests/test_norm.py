@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Normalizations tests (no GL context needed). '''
+import os
+import sys
+import types
+import unittest
+import numpy
+
+# Importing glumpy opens a window, modules are loaded from the package
+# directory without running glumpy/__init__.py
+if 'glumpy' not in sys.modules:
+    package = types.ModuleType('glumpy')
+    package.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'glumpy')]
+    sys.modules['glumpy'] = package
+from glumpy import norm
+
+
+class TestLog(unittest.TestCase):
+
+    def test_non_positive_vmin(self):
+        N = norm.get_norm('log')
+        bias, scale = N.bias_scale(0.0, 10.0)
+        self.assertTrue(numpy.isfinite(bias) and numpy.isfinite(scale))
+        self.assertAlmostEqual(numpy.log(10.0)*scale + bias, 1.0)
+
+    def test_floor_from_data(self):
+        Z = numpy.array([-1.0, 0.0, 0.5, 2.0, 8.0], dtype=numpy.float32)
+        N = norm.Log()
+        N.update(Z, Z.min(), Z.max())
+        T = N(Z, Z.min(), Z.max())
+        self.assertAlmostEqual(T[2], 0.0, places=5)
+        self.assertAlmostEqual(T[4], 1.0, places=5)
+        self.assertTrue((T[:2] < 0).all())
+
+    def test_floor_sampled(self):
+        Z = numpy.zeros((512,512), dtype=numpy.float32)
+        Z[::4,::4] = numpy.linspace(0.5, 8.0, 128*128).reshape(128,128)
+        Z[1,1] = numpy.nan
+        N = norm.Log(samples=1024)
+        N.update(Z, 0.0, 8.0)
+        self.assertTrue(0.5 <= N._floor < 8.0)
+
+    def test_no_positive_value(self):
+        N = norm.Log()
+        Z = numpy.array([-2.0, -1.0], dtype=numpy.float32)
+        N.update(Z, -2.0, -1.0)
+        self.assertEqual(N.bias_scale(-2.0, -1.0), (0.0, 1.0))
+
+
+class TestLinear(unittest.TestCase):
+
+    def test_bounds(self):
+        T = norm.Norm()(numpy.array([2.0, 4.0, 6.0]), 2.0, 6.0)
+        self.assertTrue(numpy.allclose(T, [0.0, 0.5, 1.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2009-2010  Nicolas P. Rougier
+#
+# Distributed under the terms of the BSD License. The full license is in
+# the file COPYING, distributed as part of this software.
+# -----------------------------------------------------------------------------
+''' Shader variants tests (no GL context needed). '''
+import os
+import sys
+import types
+import unittest
+
+# Importing glumpy opens a window, modules are loaded from the package
+# directory without running glumpy/__init__.py
+if 'glumpy' not in sys.modules:
+    package = types.ModuleType('glumpy')
+    package.__path__ = [os.path.join(os.path.dirname(__file__), '..', 'glumpy')]
+    sys.modules['glumpy'] = package
+from glumpy import shader
+
+
+class TestVariants(unittest.TestCase):
+
+    def test_exclusive_norms(self):
+        variants = list(shader.Nearest.variants())
+        # 4 independent flags, no normalization or one of 4
+        self.assertEqual(len(variants), 2**4 * 5)
+        for features in variants:
+            norms = [name for name in features
+                     if name.startswith('norm_') and features[name]]
+            self.assertTrue(len(norms) <= 1)
+        unique = set(tuple(sorted(f.items())) for f in variants)
+        self.assertEqual(len(unique), len(variants))
+
+    def test_blit(self):
+        variants = list(shader.Blit.variants())
+        self.assertEqual(len(variants), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()